@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Fingerprinted, pre-compressed static assets.
+
+Run at build time (`python assets.py`) to copy static/css and static/js into
+static/dist with a content hash in each file name, write gzip (and brotli,
+if the Brotli package is installed) variants next to them, and record the
+mapping in static/dist/manifest.json.
+
+At runtime, register_assets(app) adds an `asset_url()` template helper that
+resolves names through the manifest, and serves static/dist, picking the
+pre-compressed variant the client accepts. Fingerprinted files get far-future
+immutable caching; the manifest is revalidated on every use.
+Without a manifest (local development) asset_url() falls back to the plain
+static files.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+SOURCE_DIRS = ('css', 'js')
+ONE_YEAR = 365 * 24 * 60 * 60
+# Built names are <stem>.<12 hex digits of the content hash>.<ext>
+FINGERPRINTED = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+# (Accept-Encoding token, file suffix), in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def build():
+    """Write fingerprinted and compressed copies of the source assets to static/dist"""
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    os.makedirs(DIST_DIR)
+
+    manifest = {}
+    for source_dir in SOURCE_DIRS:
+        for filename in sorted(os.listdir(os.path.join(STATIC_DIR, source_dir))):
+            with open(os.path.join(STATIC_DIR, source_dir, filename), 'rb') as f:
+                content = f.read()
+            stem, ext = os.path.splitext(filename)
+            digest = hashlib.sha256(content).hexdigest()[:12]
+            built_name = f'{stem}.{digest}{ext}'
+
+            built_path = os.path.join(DIST_DIR, built_name)
+            with open(built_path, 'wb') as f:
+                f.write(content)
+            with open(built_path + '.gz', 'wb') as f:
+                f.write(gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(built_path + '.br', 'wb') as f:
+                    f.write(brotli.compress(content, quality=11))
+
+            manifest[f'{source_dir}/{filename}'] = f'dist/{built_name}'
+            print(f"{source_dir}/{filename} -> dist/{built_name}")
+
+    with open(MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    if brotli is None:
+        print("Brotli not installed; only gzip variants were written")
+    return manifest
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def serve_dist(filename):
+    """Serve a built asset, pre-compressed when the client accepts it
+
+    Fingerprinted files are cached forever; anything else in static/dist, such
+    as manifest.json, changes under the same name and is revalidated instead.
+    """
+    fingerprinted = FINGERPRINTED.search(filename) is not None
+    max_age = ONE_YEAR if fingerprinted else 0
+    accepted = request.accept_encodings
+    mimetype = mimetypes.guess_type(filename)[0]
+    # Highest q-value first, ties in ENCODINGS order; q=0 means "not acceptable"
+    for encoding, suffix in sorted(ENCODINGS, key=lambda e: -accepted.quality(e[0])):
+        if accepted.quality(encoding) > 0 and os.path.isfile(os.path.join(DIST_DIR, filename + suffix)):
+            response = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetype,
+                                           max_age=max_age)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(DIST_DIR, filename, mimetype=mimetype, max_age=max_age)
+    response.vary.add('Accept-Encoding')
+    if fingerprinted:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+# Loaded by register_assets(); empty until then, which means "use the source files"
+_manifest = {}
+
+
+def _dist_url(built):
+    return url_for('serve_dist', filename=built[len('dist/'):])
+
+
+def asset_url(name):
+    """URL of a css/ or js/ asset, fingerprinted when built"""
+    built = _manifest.get(name)
+    if built is None:
+        return url_for('static', filename=name)
+    return _dist_url(built)
+
+
+def register_assets(app):
+    """Load the build manifest, add the template helpers and the static/dist route"""
+    _manifest.update(load_manifest())
+    app.add_url_rule('/static/dist/<path:filename>', 'serve_dist', serve_dist)
+    app.add_template_global(asset_url)
+
+
+if __name__ == '__main__':
+    build()
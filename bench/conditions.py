@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of weather type classification.
+
+Compares, over a sample of WeatherAPI conditions:
+
+    substring   the former get_weather_type(): lowercase the condition text
+                and scan it for keywords
+    lookup      conditions.weather_type(): one table index per condition code
+    vectorized  conditions.classify(): one NumPy pass over an array of codes
+
+and lists how each condition's bucket changed between the old and new
+classification.
+
+Usage:
+    python bench/conditions.py
+    python bench/conditions.py --entries 100000 --runs 7
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conditions import classify, weather_type  # noqa: E402
+
+# WeatherAPI condition codes and their daytime text; by night 1000 reads "Clear"
+CONDITIONS = {
+    1000: 'Sunny', 1003: 'Partly cloudy', 1006: 'Cloudy', 1009: 'Overcast', 1030: 'Mist',
+    1063: 'Patchy rain possible', 1066: 'Patchy snow possible', 1069: 'Patchy sleet possible',
+    1072: 'Patchy freezing drizzle possible', 1087: 'Thundery outbreaks possible',
+    1114: 'Blowing snow', 1117: 'Blizzard', 1135: 'Fog', 1147: 'Freezing fog',
+    1150: 'Patchy light drizzle', 1153: 'Light drizzle', 1168: 'Freezing drizzle',
+    1171: 'Heavy freezing drizzle', 1180: 'Patchy light rain', 1183: 'Light rain',
+    1186: 'Moderate rain at times', 1189: 'Moderate rain', 1192: 'Heavy rain at times',
+    1195: 'Heavy rain', 1198: 'Light freezing rain', 1201: 'Moderate or heavy freezing rain',
+    1204: 'Light sleet', 1207: 'Moderate or heavy sleet', 1210: 'Patchy light snow',
+    1213: 'Light snow', 1216: 'Patchy moderate snow', 1219: 'Moderate snow',
+    1222: 'Patchy heavy snow', 1225: 'Heavy snow', 1237: 'Ice pellets',
+    1240: 'Light rain shower', 1243: 'Moderate or heavy rain shower', 1246: 'Torrential rain shower',
+    1249: 'Light sleet showers', 1252: 'Moderate or heavy sleet showers',
+    1255: 'Light snow showers', 1258: 'Moderate or heavy snow showers',
+    1261: 'Light showers of ice pellets', 1264: 'Moderate or heavy showers of ice pellets',
+    1273: 'Patchy light rain with thunder', 1276: 'Moderate or heavy rain with thunder',
+    1279: 'Patchy light snow with thunder', 1282: 'Moderate or heavy snow with thunder',
+}
+
+
+def substring_weather_type(condition):
+    """The classifier this replaced, kept here for comparison"""
+    condition = condition.lower()
+    if any(word in condition for word in ['rain', 'drizzle', 'shower']):
+        return 'rainy'
+    elif any(word in condition for word in ['cloud', 'overcast']):
+        return 'cloudy'
+    elif any(word in condition for word in ['clear', 'sunny']):
+        return 'clear'
+    return 'default'
+
+
+def condition_text(code, is_day):
+    return 'Clear' if code == 1000 and not is_day else CONDITIONS[code]
+
+
+def best_of(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=10000, help='Conditions classified per run')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    codes = [rng.choice(list(CONDITIONS)) for _ in range(args.entries)]
+    is_day = [rng.randint(0, 1) for _ in range(args.entries)]
+    texts = [condition_text(code, day) for code, day in zip(codes, is_day)]
+
+    import numpy as np
+    code_array, day_array = np.array(codes), np.array(is_day)
+    classify(code_array[:1])  # import NumPy and build the lookup arrays outside the timings
+
+    implementations = {
+        'substring': lambda: [substring_weather_type(text) for text in texts],
+        'lookup': lambda: [weather_type(code, day) for code, day in zip(codes, is_day)],
+        'vectorized': lambda: classify(code_array, day_array),
+    }
+    results = {'entries': args.entries}
+    for name, fn in implementations.items():
+        best, median = best_of(fn, args.runs)
+        results[name] = {
+            'best_ms': round(best * 1000, 3),
+            'median_ms': round(median * 1000, 3),
+            'ns_per_entry': round(best / args.entries * 1e9, 1),
+        }
+
+    changes = Counter()
+    for code in CONDITIONS:
+        for day in (1, 0):
+            old, new = substring_weather_type(condition_text(code, day)), weather_type(code, day)
+            if old != new:
+                changes[f'{old} -> {new}'] += 1
+    results['reclassified_conditions'] = dict(changes.most_common())
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
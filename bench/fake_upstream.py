@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for WeatherAPI and Google's OAuth endpoints.
+
+Serves forecast.json, the OAuth token endpoint, userinfo and the signing-key
+JWKS from one threaded HTTP server, with configurable latency and error
+injection per route. ID tokens are signed with a throwaway RSA key that the
+JWKS route publishes, so the app verifies them exactly as it would Google's.
+
+Usage:
+    python bench/fake_upstream.py --port 8900 --latency forecast=80 --errors forecast=0.01
+
+Point the app at it with:
+    WEATHER_API_URL=http://127.0.0.1:8900/v1/forecast.json
+    GOOGLE_TOKEN_URL=http://127.0.0.1:8900/token
+    GOOGLE_USERINFO_URL=http://127.0.0.1:8900/oauth2/v2/userinfo
+    GOOGLE_CERTS_URL=http://127.0.0.1:8900/oauth2/v3/certs
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+ROUTES = {
+    '/v1/forecast.json': 'forecast',
+    '/token': 'token',
+    '/oauth2/v2/userinfo': 'userinfo',
+    '/oauth2/v3/certs': 'certs',
+}
+
+CONDITIONS = [
+    (1000, 'Sunny'), (1003, 'Partly cloudy'), (1009, 'Overcast'),
+    (1063, 'Patchy rain possible'), (1183, 'Light rain'), (1213, 'Light snow'),
+    (1276, 'Moderate or heavy rain with thunder'),
+]
+
+KEY_ID = 'bench-key'
+
+
+class FakeUpstream:
+    """Shared state for the fake server: signing key, injection settings and call counts"""
+
+    def __init__(self, client_id, latency=None, errors=None):
+        self.client_id = client_id
+        self.latency = latency or {}
+        self.errors = errors or {}
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(RSAAlgorithm.to_jwk(self.private_key.public_key()))
+        jwk.update(kid=KEY_ID, alg='RS256', use='sig')
+        self.jwks = {'keys': [jwk]}
+        self.counts = dict.fromkeys(ROUTES.values(), 0)
+        self._lock = threading.Lock()
+
+    def count(self, route):
+        with self._lock:
+            self.counts[route] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def id_token(self, user_id):
+        now = int(time.time())
+        claims = {
+            'iss': 'https://accounts.google.com',
+            'aud': self.client_id,
+            'sub': user_id,
+            'email': f'{user_id}@example.com',
+            'name': f'Bench User {user_id}',
+            'iat': now,
+            'exp': now + 3600,
+        }
+        return jwt.encode(claims, self.private_key, algorithm='RS256', headers={'kid': KEY_ID})
+
+    def forecast(self, city, hour=None):
+        rng = random.Random(city)
+        code, text = rng.choice(CONDITIONS)
+        now = time.time()
+        # Observations change every 15 minutes, like WeatherAPI's
+        observed = int(now // 900 * 900)
+        days = []
+        for offset in range(5):
+            date = time.strftime('%Y-%m-%d', time.gmtime(now + offset * 86400))
+            hours = range(24) if hour is None else [int(hour)]
+            days.append({
+                'date': date,
+                'date_epoch': int(now) + offset * 86400,
+                'day': {
+                    'maxtemp_c': round(rng.uniform(15, 35), 1),
+                    'mintemp_c': round(rng.uniform(-5, 15), 1),
+                    'avgtemp_c': round(rng.uniform(5, 25), 1),
+                    'maxwind_kph': round(rng.uniform(0, 50), 1),
+                    'totalprecip_mm': round(rng.uniform(0, 20), 1),
+                    'avghumidity': rng.randint(20, 100),
+                    'daily_chance_of_rain': rng.randint(0, 100),
+                    'condition': {'text': text, 'code': code, 'icon': '//cdn/icon.png'},
+                    'uv': 4.0,
+                },
+                'astro': {'sunrise': '06:45 AM', 'sunset': '07:30 PM'},
+                'hour': [{
+                    'time': f'{date} {h:02d}:00',
+                    'time_epoch': int(now) + h * 3600,
+                    'temp_c': round(rng.uniform(0, 30), 1),
+                    'is_day': int(6 <= h < 19),
+                    'condition': {'text': text, 'code': code, 'icon': '//cdn/icon.png'},
+                    'wind_kph': round(rng.uniform(0, 40), 1),
+                    'humidity': rng.randint(20, 100),
+                    'chance_of_rain': rng.randint(0, 100),
+                    'feelslike_c': round(rng.uniform(0, 30), 1),
+                } for h in hours],
+            })
+        return {
+            'location': {
+                'name': city.title(),
+                'region': '',
+                'country': 'Benchland',
+                'lat': 0.0,
+                'lon': 0.0,
+                'tz_id': 'UTC',
+                'localtime': time.strftime('%Y-%m-%d %H:%M', time.gmtime(now)),
+                'localtime_epoch': int(now),
+            },
+            'current': {
+                'last_updated': time.strftime('%Y-%m-%d %H:%M', time.gmtime(observed)),
+                'last_updated_epoch': observed,
+                'temp_c': round(rng.uniform(0, 30), 1),
+                'is_day': 1,
+                'condition': {'text': text, 'code': code, 'icon': '//cdn/icon.png'},
+                'wind_kph': round(rng.uniform(0, 40), 1),
+                'humidity': rng.randint(20, 100),
+                'feelslike_c': round(rng.uniform(0, 30), 1),
+            },
+            'forecast': {'forecastday': days},
+        }
+
+
+def make_handler(upstream):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body, headers=None):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _handle(self):
+            url = urlsplit(self.path)
+            if url.path == '/__stats':
+                return self._send_json(200, upstream.stats())
+
+            route = ROUTES.get(url.path)
+            if route is None:
+                return self._send_json(404, {'error': 'not found'})
+
+            length = int(self.headers.get('Content-Length') or 0)
+            body = parse_qs(self.rfile.read(length).decode('utf-8')) if length else {}
+            query = parse_qs(url.query)
+            upstream.count(route)
+
+            time.sleep(upstream.latency.get(route, 0) / 1000.0)
+            if random.random() < upstream.errors.get(route, 0):
+                return self._send_json(503, {'error': 'injected failure'})
+
+            if route == 'forecast':
+                city = query.get('q', ['london'])[0]
+                return self._send_json(200, upstream.forecast(city, query.get('hour', [None])[0]))
+            if route == 'token':
+                user_id = body.get('code', ['bench'])[0]
+                return self._send_json(200, {
+                    'access_token': f'access-{user_id}',
+                    'id_token': upstream.id_token(user_id),
+                    'expires_in': 3599,
+                    'token_type': 'Bearer',
+                })
+            if route == 'userinfo':
+                user_id = self.headers.get('Authorization', 'Bearer access-bench').split('access-', 1)[-1]
+                return self._send_json(200, {
+                    'id': user_id,
+                    'email': f'{user_id}@example.com',
+                    'name': f'Bench User {user_id}',
+                })
+            return self._send_json(200, upstream.jwks, {'Cache-Control': 'public, max-age=21600'})
+
+        do_GET = _handle
+        do_POST = _handle
+
+    return Handler
+
+
+def serve(port, upstream):
+    """Start the fake server on a background thread and return it"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(upstream))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-upstream', daemon=True).start()
+    return server
+
+
+def parse_route_values(values):
+    """Parse repeated ROUTE=VALUE options ('all' applies to every route)"""
+    result = {}
+    for item in values or []:
+        route, value = item.split('=', 1)
+        for name in (ROUTES.values() if route == 'all' else [route]):
+            result[name] = float(value)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--client-id', default='bench-client-id')
+    parser.add_argument('--latency', action='append', metavar='ROUTE=MS',
+                        help='Added latency per route (forecast, token, userinfo, certs or all)')
+    parser.add_argument('--errors', action='append', metavar='ROUTE=RATE',
+                        help='Fraction of requests answered with a 503 per route')
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(args.client_id, parse_route_values(args.latency), parse_route_values(args.errors))
+    server = serve(args.port, upstream)
+    print(f"Fake upstream listening on http://127.0.0.1:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Load test for weather_app against local upstream stand-ins.
+
+Starts bench/fake_upstream.py in-process, launches the real app under
+gunicorn pointed at it, then drives each scenario at a fixed concurrency for
+a fixed duration and reports throughput, p50/p95/p99 latency and how many
+upstream calls the scenario caused.
+
+Scenarios:
+    search  POST /              anonymous city lookups, Zipf-distributed over --cities
+    auth    POST /auth/google   sign-in with a freshly signed ID token
+    edit    POST /edit_location rename a saved location
+    delete  POST /delete_location  remove a saved location (re-added between iterations, not timed)
+
+Results can be saved as a baseline; later runs are compared against it and
+the script exits non-zero if p95 latency or throughput regressed beyond
+--tolerance.
+
+Usage:
+    python bench/loadtest.py --concurrency 16 --duration 20 --latency forecast=80
+    python bench/loadtest.py --mode async --concurrency 200 --latency forecast=500
+    python bench/loadtest.py --save-baseline
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_upstream import FakeUpstream, parse_route_values, serve  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(REPO_ROOT, 'bench', 'baselines.json')
+SCENARIOS = ('search', 'auth', 'edit', 'delete')
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+
+class Scenario:
+    """One request type driven by many client threads"""
+
+    def __init__(self, name, app_url, upstream, cities):
+        self.name = name
+        self.app_url = app_url
+        self.upstream = upstream
+        self.cities = cities
+        # Zipf-like popularity: city i is requested with weight 1 / (i + 1)
+        self.weights = list(itertools.accumulate(1.0 / (i + 1) for i in range(len(cities))))
+
+    def pick_city(self, rng):
+        return rng.choices(self.cities, cum_weights=self.weights)[0]
+
+    def login(self, client, user_id):
+        response = client.post(f'{self.app_url}/auth/google',
+                               json={'credential': self.upstream.id_token(user_id)})
+        return response.ok and response.json().get('success')
+
+    def setup(self, client, worker_id):
+        """Per-thread preparation; returns state passed to each iteration"""
+        if self.name in ('edit', 'delete'):
+            self.login(client, f'bench-{self.name}-{worker_id}')
+            city = self.cities[worker_id % len(self.cities)]
+            self.save_location(client, city)
+            return {'city': city, 'name': city.title(), 'n': 0}
+        return {}
+
+    def save_location(self, client, city):
+        client.post(f'{self.app_url}/', data={
+            'city': city, 'display_name': city.title(), 'save_location': 'true'})
+
+    def run_once(self, client, rng, state):
+        """Send one timed request; returns (seconds, ok)"""
+        if self.name == 'search':
+            start = time.perf_counter()
+            response = client.post(f'{self.app_url}/', data={'city': self.pick_city(rng)})
+            return time.perf_counter() - start, response.status_code == 200
+
+        if self.name == 'auth':
+            credential = self.upstream.id_token(f'bench-auth-{rng.randrange(1000)}')
+            start = time.perf_counter()
+            response = client.post(f'{self.app_url}/auth/google', json={'credential': credential})
+            elapsed = time.perf_counter() - start
+            client.cookies.clear()
+            return elapsed, response.ok and response.json().get('success')
+
+        if self.name == 'edit':
+            state['n'] += 1
+            new_name = f"{state['city'].title()} {state['n']}"
+            start = time.perf_counter()
+            response = client.post(f'{self.app_url}/edit_location', json={
+                'city': state['city'], 'old_name': state['name'], 'new_name': new_name})
+            elapsed = time.perf_counter() - start
+            ok = response.ok and response.json().get('success')
+            if ok:
+                state['name'] = new_name
+            return elapsed, ok
+
+        start = time.perf_counter()
+        response = client.post(f'{self.app_url}/delete_location', json={
+            'city': state['city'], 'name': state['name']})
+        elapsed = time.perf_counter() - start
+        ok = response.ok and response.json().get('success')
+        self.save_location(client, state['city'])
+        return elapsed, ok
+
+
+def run_scenario(scenario, concurrency, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    ready = threading.Barrier(concurrency + 1)
+    go = threading.Event()
+    deadline = [0.0]
+
+    def worker(worker_id):
+        rng = random.Random(worker_id)
+        client = requests.Session()
+        state = scenario.setup(client, worker_id)
+        ready.wait()
+        go.wait()
+        local = []
+        local_errors = 0
+        while time.perf_counter() < deadline[0]:
+            try:
+                elapsed, ok = scenario.run_once(client, rng, state)
+            except requests.RequestException:
+                elapsed, ok = 0.0, False
+            local.append(elapsed)
+            if not ok:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    # Start the clock once every client has finished its setup
+    ready.wait()
+    calls_before = scenario.upstream.stats()
+    started = time.perf_counter()
+    deadline[0] = started + duration
+    go.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    calls_after = scenario.upstream.stats()
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'upstream_calls': {route: calls_after[route] - calls_before[route] for route in calls_after
+                           if calls_after[route] != calls_before[route]},
+    }
+
+
+def start_app(port, upstream_url, client_id, workers, threads, workdir, mode='sync'):
+    env = dict(os.environ)
+    env.update(
+        WEATHER_API_KEY='bench',
+        GOOGLE_CLIENT_ID=client_id,
+        WEATHER_API_URL=f'{upstream_url}/v1/forecast.json',
+        GOOGLE_TOKEN_URL=f'{upstream_url}/token',
+        GOOGLE_USERINFO_URL=f'{upstream_url}/oauth2/v2/userinfo',
+        GOOGLE_CERTS_URL=f'{upstream_url}/oauth2/v3/certs',
+        LOCATION_STORE_PATH=os.path.join(workdir, 'locations.sqlite3'),
+        FORECAST_CACHE_PATH=os.path.join(workdir, 'forecast_cache.sqlite3'),
+        FORECAST_SNAPSHOT_PATH=os.path.join(workdir, 'forecast_snapshot.bin'),
+        WEATHER_API_RATE_PATH=os.path.join(workdir, 'rate_limit.sqlite3'),
+    )
+    # Measure the app, not the quota governor, unless asked otherwise
+    env.setdefault('WEATHER_API_CALLS_PER_MINUTE', '1000000')
+    command = [sys.executable, '-m', 'gunicorn', 'weather_app:app',
+               '--bind', f'127.0.0.1:{port}', '--workers', str(workers)]
+    if mode == 'async':
+        # gunicorn.conf.py picks the gevent worker class and patches before loading the app
+        env['SERVING_MODE'] = 'async'
+    else:
+        env['SERVING_MODE'] = 'sync'
+        command += ['--worker-class', 'gthread', '--threads', str(threads)]
+    log = open(os.path.join(workdir, 'gunicorn.log'), 'w')
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    app_url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited early, see {log.name}")
+        try:
+            requests.get(f'{app_url}/auth', timeout=1, allow_redirects=False)
+            return process, app_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"gunicorn did not start, see {log.name}")
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regression messages"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if result['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {result['throughput_rps']}/s vs baseline {base['throughput_rps']}/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='Scenario to run (repeatable, default: all)')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per scenario')
+    parser.add_argument('--cities', type=int, default=200, help='Number of distinct cities searched')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker (sync mode)')
+    parser.add_argument('--mode', choices=('sync', 'async'), default='sync',
+                        help='Threaded workers, or gevent workers (SERVING_MODE=async)')
+    parser.add_argument('--app-port', type=int, default=8901)
+    parser.add_argument('--upstream-port', type=int, default=8900)
+    parser.add_argument('--latency', action='append', metavar='ROUTE=MS',
+                        help='Fake upstream latency per route (forecast, token, userinfo, certs or all)')
+    parser.add_argument('--errors', action='append', metavar='ROUTE=RATE',
+                        help='Fake upstream 503 rate per route')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative regression against the baseline')
+    args = parser.parse_args()
+
+    client_id = 'bench-client-id'
+    upstream = FakeUpstream(client_id, parse_route_values(args.latency), parse_route_values(args.errors))
+    server = serve(args.upstream_port, upstream)
+    upstream_url = f'http://127.0.0.1:{server.server_port}'
+    cities = [f'city {i}' for i in range(args.cities)]
+
+    with tempfile.TemporaryDirectory(prefix='weather-bench-') as workdir:
+        process, app_url = start_app(args.app_port, upstream_url, client_id,
+                                     args.workers, args.threads, workdir, args.mode)
+        try:
+            results = {}
+            for name in args.scenario or SCENARIOS:
+                print(f"Running {name} ({args.concurrency} clients, {args.duration}s)...")
+                results[name] = run_scenario(Scenario(name, app_url, upstream, cities),
+                                             args.concurrency, args.duration)
+        finally:
+            process.terminate()
+            process.wait()
+            server.shutdown()
+
+    print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for message in regressions:
+                print(f"  - {message}")
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
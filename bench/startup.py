@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Startup-time measurement for weather_app.
+
+Reports two things:
+
+    import   `python -X importtime -c "import weather_app"`, repeated; the
+             median total and the top-level packages that cost the most
+    boot     time from launching gunicorn until the first request is answered,
+             and the latency of the first and a later GET /, with and without
+             --preload
+
+Usage:
+    python bench/startup.py
+    python bench/startup.py --runs 5 --workers 4 --skip-boot
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_profile(runs, top):
+    totals = []
+    by_package = defaultdict(list)
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import weather_app'],
+            cwd=REPO_ROOT, capture_output=True, text=True, env=dict(os.environ, LOG_LEVEL='ERROR'))
+        self_times = defaultdict(int)
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            name = name.strip()
+            self_times[name.split('.')[0]] += int(self_us)
+            if name == 'weather_app':
+                totals.append(int(cumulative_us) / 1000)
+        for package, us in self_times.items():
+            by_package[package].append(us / 1000)
+
+    packages = sorted(((statistics.median(ms), package) for package, ms in by_package.items()), reverse=True)
+    return {
+        'total_ms': round(statistics.median(totals), 1),
+        'top_packages_ms': {package: round(ms, 1) for ms, package in packages[:top]},
+    }
+
+
+def boot_time(port, workers, preload, workdir):
+    env = dict(os.environ)
+    env.update(
+        LOG_LEVEL='WARNING',
+        GUNICORN_PRELOAD='true' if preload else 'false',
+        LOCATION_STORE_PATH=os.path.join(workdir, 'locations.sqlite3'),
+        FORECAST_CACHE_PATH=os.path.join(workdir, 'forecast_cache.sqlite3'),
+        FORECAST_SNAPSHOT_PATH=os.path.join(workdir, 'forecast_snapshot.bin'),
+        WEATHER_API_RATE_PATH=os.path.join(workdir, 'rate_limit.sqlite3'),
+    )
+    url = f'http://127.0.0.1:{port}/'
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'weather_app:app', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers)],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError("gunicorn exited during startup")
+            try:
+                request_start = time.perf_counter()
+                requests.get(url, timeout=5)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.01)
+        first_request = time.perf_counter()
+        # A later request on a fresh connection, for comparison with the first one
+        time.sleep(0.5)
+        warm_start = time.perf_counter()
+        requests.get(url, timeout=5)
+        warm_done = time.perf_counter()
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        'time_to_first_response_ms': round((first_request - started) * 1000, 1),
+        'first_request_ms': round((first_request - request_start) * 1000, 1),
+        'warm_request_ms': round((warm_done - warm_start) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='Repetitions of each measurement')
+    parser.add_argument('--top', type=int, default=10, help='Packages listed in the import profile')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--port', type=int, default=8902)
+    parser.add_argument('--skip-boot', action='store_true', help='Only profile imports')
+    args = parser.parse_args()
+
+    results = {'import': import_profile(args.runs, args.top)}
+    if not args.skip_boot:
+        with tempfile.TemporaryDirectory(prefix='weather-startup-') as workdir:
+            for preload in (False, True):
+                runs = [boot_time(args.port, args.workers, preload, workdir) for _ in range(args.runs)]
+                results['boot_preload' if preload else 'boot'] = {
+                    key: round(statistics.median(run[key] for run in runs), 1) for key in runs[0]}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Columnar multi-location weather for the bulk API.
+
+Results for many cities are emitted in blocks: one list per current-conditions
+field, and a locations x days matrix per daily forecast field, including each
+day's weather type, classified from the condition codes in one vectorized
+pass. Per-day minimum, maximum and average across all locations are kept as
+running NumPy aggregates, so a response of any length is summarized without
+holding every block in memory.
+"""
+
+from conditions import classify
+from numpy_util import numpy
+
+CURRENT_FIELDS = ('name', 'location', 'temp_c', 'feels_like_c', 'humidity', 'wind_kph',
+                  'condition', 'weather_type', 'last_updated')
+DAILY_FIELDS = ('max_c', 'min_c', 'avg_c', 'chance_of_rain')
+
+
+def _to_json(array):
+    """NumPy array to nested lists rounded to 2 decimals, with NaN (no data) as null"""
+    np = numpy()
+    return np.where(np.isnan(array), None, np.round(array, 2)).tolist()
+
+
+def daily_matrix(results, field, days):
+    """locations x days float matrix of a daily forecast field; NaN where a location has no data"""
+    np = numpy()
+    matrix = np.full((len(results), days), np.nan)
+    for row, (_, weather_data, _) in enumerate(results):
+        if weather_data is None:
+            continue
+        values = weather_data['forecast']['days'][field][:days]
+        matrix[row, :len(values)] = values
+    return matrix
+
+
+def columnar_block(results, days):
+    """One block of the response for [(city, weather data or None, error or None), ...]
+
+    Returns the JSON-ready block and the daily matrices for DailyAggregator.
+    """
+    found = [weather_data or {} for _, weather_data, _ in results]
+    matrices = {field: daily_matrix(results, field, days) for field in DAILY_FIELDS}
+    block = {
+        'type': 'locations',
+        'city': [city for city, _, _ in results],
+        'error': [error for _, _, error in results],
+        'stale': [bool(weather_data.get('stale')) for weather_data in found],
+        'current': {field: [weather_data.get(field) for weather_data in found] for field in CURRENT_FIELDS},
+        'daily': {
+            'date': [weather_data['forecast']['days']['date'][:days] if weather_data else None
+                     for weather_data in found],
+        },
+    }
+    for field, matrix in matrices.items():
+        block['daily'][field] = _to_json(matrix)
+    weather_types = classify(daily_matrix(results, 'condition_code', days)).tolist()
+    block['daily']['weather_type'] = [row if weather_data else None
+                                      for row, weather_data in zip(weather_types, found)]
+    return block, matrices
+
+
+class DailyAggregator:
+    """Running per-day min, max and average of each daily field across locations"""
+
+    def __init__(self, days):
+        np = numpy()
+        self.days = days
+        self.locations = 0
+        self.errors = 0
+        self._min = {field: np.full(days, np.nan) for field in DAILY_FIELDS}
+        self._max = {field: np.full(days, np.nan) for field in DAILY_FIELDS}
+        self._sum = {field: np.zeros(days) for field in DAILY_FIELDS}
+        self._count = {field: np.zeros(days, dtype=np.int64) for field in DAILY_FIELDS}
+
+    def update(self, block, matrices):
+        np = numpy()
+        self.locations += len(block['city'])
+        self.errors += sum(error is not None for error in block['error'])
+        for field, matrix in matrices.items():
+            if not len(matrix):
+                continue
+            # fmin/fmax ignore NaN unless every value is NaN
+            self._min[field] = np.fmin(self._min[field], np.fmin.reduce(matrix, axis=0))
+            self._max[field] = np.fmax(self._max[field], np.fmax.reduce(matrix, axis=0))
+            self._sum[field] += np.nansum(matrix, axis=0)
+            self._count[field] += np.count_nonzero(~np.isnan(matrix), axis=0)
+
+    def summary(self):
+        np = numpy()
+        daily = {}
+        for field in DAILY_FIELDS:
+            count = self._count[field]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                average = np.where(count > 0, self._sum[field] / count, np.nan)
+            daily[field] = {
+                'min': _to_json(self._min[field]),
+                'max': _to_json(self._max[field]),
+                'avg': _to_json(average),
+            }
+        return {'type': 'summary', 'locations': self.locations, 'errors': self.errors, 'daily': daily}
@@ -0,0 +1,69 @@
+"""
+Weather type (background bucket) for WeatherAPI condition codes.
+
+WeatherAPI reports conditions as one of 48 numeric codes between 1000 and
+1282 (https://www.weatherapi.com/docs/weather_conditions.json), the same
+code by day and by night. They are mapped once, at import, into a table
+indexed by [is_day][code - 1000], so classifying a condition is one list
+index, and a whole array of forecast codes is one NumPy take.
+"""
+
+from numpy_util import numpy
+
+WEATHER_TYPES = ('default', 'sunny', 'clear', 'cloudy', 'rainy', 'stormy', 'snowy')
+
+FIRST_CODE = 1000
+LAST_CODE = 1282
+
+# Codes by bucket; 1000 is "Sunny" by day and "Clear" by night, and mist and
+# fog (1030, 1135, 1147) keep the default background
+_CODES = {
+    'cloudy': (1003, 1006, 1009),
+    'rainy': (1063, 1072, 1150, 1153, 1168, 1171, 1180, 1183, 1186, 1189, 1192, 1195,
+              1198, 1201, 1240, 1243, 1246),
+    'stormy': (1087, 1273, 1276, 1279, 1282),
+    'snowy': (1066, 1069, 1114, 1117, 1204, 1207, 1210, 1213, 1216, 1219, 1222, 1225,
+              1237, 1249, 1252, 1255, 1258, 1261, 1264),
+}
+
+
+def _build_table():
+    """[night, day] rows of WEATHER_TYPES indexes, one entry per code from FIRST_CODE to LAST_CODE"""
+    default = WEATHER_TYPES.index('default')
+    table = [[default] * (LAST_CODE - FIRST_CODE + 1) for _ in range(2)]
+    for name, codes in _CODES.items():
+        for code in codes:
+            table[0][code - FIRST_CODE] = table[1][code - FIRST_CODE] = WEATHER_TYPES.index(name)
+    table[0][1000 - FIRST_CODE] = WEATHER_TYPES.index('clear')
+    table[1][1000 - FIRST_CODE] = WEATHER_TYPES.index('sunny')
+    return table
+
+
+_TABLE = _build_table()
+_NAMES = [[WEATHER_TYPES[i] for i in row] for row in _TABLE]
+_arrays = None
+
+
+def weather_type(code, is_day=1):
+    """Weather type for one condition code; 'default' for codes WeatherAPI doesn't define"""
+    if not isinstance(code, int) or not FIRST_CODE <= code <= LAST_CODE:
+        return 'default'
+    return _NAMES[1 if is_day else 0][code - FIRST_CODE]
+
+
+def classify(codes, is_day=1):
+    """Weather types for an array of condition codes (any shape), as a NumPy array of strings
+
+    `is_day` is a scalar or an array broadcastable to `codes`; missing codes
+    may be given as NaN and classify as 'default'.
+    """
+    global _arrays
+    np = numpy()
+    if _arrays is None:
+        _arrays = np.asarray(_TABLE, dtype=np.uint8), np.asarray(WEATHER_TYPES)
+    table, names = _arrays
+    codes = np.asarray(codes, dtype=np.float64)
+    valid = (codes >= FIRST_CODE) & (codes <= LAST_CODE)
+    offsets = np.where(valid, codes - FIRST_CODE, 0).astype(np.intp)
+    day = (np.asarray(is_day) != 0).astype(np.intp)
+    return names[np.where(valid, table[day, offsets], WEATHER_TYPES.index('default'))]
@@ -0,0 +1,232 @@
+"""
+Forecast cache for WeatherAPI lookups.
+
+Entries are keyed on the normalized city and expire after a TTL. Expired
+entries are kept for a further stale window so they can be served while a
+refresh is in flight (stale-while-revalidate).
+
+Two backends are provided: an in-process LRU and a SQLite-backed store that
+every gunicorn worker on the host can share. Any object with the same
+get/set/delete methods can be plugged in as a backend.
+
+An optional persistent snapshot (forecast_snapshot.py) sits behind the
+backend: every stored forecast is queued to it (and written by a background
+thread), and backend misses are filled from it, so the cache survives
+restarts and deploys.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from forecast_snapshot import ForecastSnapshot
+from sqlite_util import connect
+
+
+def normalize_city(city):
+    """Normalize free-text city input into a cache key"""
+    return ' '.join((city or '').strip().lower().split())
+
+
+class MemoryBackend:
+    """In-process LRU store bounded by entry count"""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (value, expires_at) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, expires_at):
+        """Store an entry and return how many entries were evicted"""
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """Shared LRU store in a SQLite file, visible to every worker on the host"""
+
+    def __init__(self, path, max_entries=4096):
+        self.path = path
+        self.max_entries = max_entries
+        connect(self.path).execute(
+            'CREATE TABLE IF NOT EXISTS forecast_cache ('
+            ' key TEXT PRIMARY KEY,'
+            ' value TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL,'
+            ' last_access REAL NOT NULL)'
+        )
+        connect(self.path).execute(
+            'CREATE INDEX IF NOT EXISTS forecast_cache_lru ON forecast_cache (last_access)'
+        )
+
+    def get(self, key):
+        conn = connect(self.path)
+        row = conn.execute(
+            'SELECT value, expires_at FROM forecast_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            'UPDATE forecast_cache SET last_access = ? WHERE key = ?', (time.time(), key)
+        )
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at):
+        conn = connect(self.path)
+        conn.execute(
+            'INSERT OR REPLACE INTO forecast_cache (key, value, expires_at, last_access)'
+            ' VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value), expires_at, time.time())
+        )
+        cursor = conn.execute(
+            'DELETE FROM forecast_cache WHERE key IN ('
+            ' SELECT key FROM forecast_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+        return max(cursor.rowcount, 0)
+
+    def delete(self, key):
+        connect(self.path).execute('DELETE FROM forecast_cache WHERE key = ?', (key,))
+
+    def __len__(self):
+        return connect(self.path).execute('SELECT COUNT(*) FROM forecast_cache').fetchone()[0]
+
+
+class ForecastCache:
+    """TTL cache of parsed forecast data with hit/miss/eviction counters"""
+
+    def __init__(self, backend, ttl=600, stale_ttl=0, snapshot=None, max_age=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_age = max_age
+        self.snapshot = snapshot
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.restored = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _get(self, key):
+        """Backend entry for a key, falling back to (and warming the backend from) the snapshot"""
+        entry = self.backend.get(key)
+        if entry is None and self.snapshot is not None:
+            entry = self.snapshot.get(key)
+            if entry is not None:
+                self._count('restored')
+                evicted = self.backend.set(key, *entry)
+                if evicted:
+                    self._count('evictions', evicted)
+        return entry
+
+    def lookup(self, city):
+        """Return (value, expires_at) for a fresh or still-servable stale entry, or None"""
+        key = normalize_city(city)
+        entry = self._get(key)
+        if entry is None:
+            self._count('misses')
+            return None
+        expires_at = entry[1]
+        now = time.time()
+        if expires_at + self.stale_ttl <= now:
+            # Kept (until LRU eviction) as a last resort when the upstream is unavailable
+            self._count('misses')
+            return None
+        self._count('hits' if expires_at > now else 'stale_hits')
+        return entry
+
+    def get(self, city):
+        """Return the cached value for a city, or None if missing or expired"""
+        entry = self.lookup(city)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def peek(self, city):
+        """Return (value, expires_at) of a retained entry up to max_age past expiry, without touching the counters"""
+        entry = self._get(normalize_city(city))
+        if entry is not None and self.max_age is not None and entry[1] + self.max_age <= time.time():
+            return None
+        return entry
+
+    def set(self, city, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        key, expires_at = normalize_city(city), time.time() + ttl
+        evicted = self.backend.set(key, value, expires_at)
+        if self.snapshot is not None:
+            self.snapshot.set(key, value, expires_at)
+        if evicted:
+            self._count('evictions', evicted)
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'ttl': self.ttl,
+            'stale_ttl': self.stale_ttl,
+            'size': len(self.backend),
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'restored': self.restored,
+            'snapshot': self.snapshot.stats() if self.snapshot is not None else None,
+        }
+
+
+def create_forecast_cache():
+    """Build the forecast cache from FORECAST_CACHE_* environment variables"""
+    backend_name = os.getenv('FORECAST_CACHE_BACKEND', 'memory').lower()
+    ttl = int(os.getenv('FORECAST_CACHE_TTL', '600'))
+    stale_ttl = int(os.getenv('FORECAST_CACHE_STALE_TTL', '300'))
+    max_entries = int(os.getenv('FORECAST_CACHE_MAX_ENTRIES', '1024'))
+
+    if backend_name == 'sqlite':
+        path = os.getenv('FORECAST_CACHE_PATH', 'forecast_cache.sqlite3')
+        backend = SQLiteBackend(path, max_entries=max_entries)
+    elif backend_name == 'memory':
+        backend = MemoryBackend(max_entries=max_entries)
+    else:
+        raise ValueError(f"Unknown FORECAST_CACHE_BACKEND: {backend_name}")
+
+    # Bounds the outage fallback for every backend, not only the snapshot
+    max_age = int(os.getenv('FORECAST_SNAPSHOT_MAX_AGE', '86400'))
+    snapshot = None
+    snapshot_path = os.getenv('FORECAST_SNAPSHOT_PATH', 'forecast_snapshot.bin')
+    if snapshot_path:
+        snapshot = ForecastSnapshot(
+            snapshot_path,
+            max_age=max_age,
+            max_entries=int(os.getenv('FORECAST_SNAPSHOT_MAX_ENTRIES', '4096')),
+        )
+
+    return ForecastCache(backend, ttl=ttl, stale_ttl=stale_ttl, snapshot=snapshot, max_age=max_age)
@@ -0,0 +1,78 @@
+"""
+Compact forecast model.
+
+WeatherAPI returns dozens of fields per day and per hour. Only the fields the
+app displays or caches are kept: they are parsed into __slots__ records and
+stored column-wise (one list per field), which is what goes into the forecast
+cache and the template context.
+"""
+
+DAY_FIELDS = ('date', 'max_c', 'min_c', 'avg_c', 'condition', 'condition_code', 'chance_of_rain')
+HOUR_FIELDS = ('time', 'temp_c', 'condition', 'condition_code', 'chance_of_rain', 'is_day')
+
+
+class ForecastDay:
+    """One day of forecast data"""
+    __slots__ = DAY_FIELDS
+
+    def __init__(self, date, max_c, min_c, avg_c, condition, condition_code, chance_of_rain):
+        self.date = date
+        self.max_c = max_c
+        self.min_c = min_c
+        self.avg_c = avg_c
+        self.condition = condition
+        self.condition_code = condition_code
+        self.chance_of_rain = chance_of_rain
+
+    @classmethod
+    def from_api(cls, forecastday):
+        day = forecastday['day']
+        return cls(
+            forecastday['date'],
+            day['maxtemp_c'],
+            day['mintemp_c'],
+            day['avgtemp_c'],
+            day['condition']['text'],
+            day['condition']['code'],
+            day.get('daily_chance_of_rain', 0),
+        )
+
+
+class ForecastHour:
+    """One hour of forecast data"""
+    __slots__ = HOUR_FIELDS
+
+    def __init__(self, time, temp_c, condition, condition_code, chance_of_rain, is_day):
+        self.time = time
+        self.temp_c = temp_c
+        self.condition = condition
+        self.condition_code = condition_code
+        self.chance_of_rain = chance_of_rain
+        self.is_day = is_day
+
+    @classmethod
+    def from_api(cls, hour):
+        return cls(
+            hour['time'],
+            hour['temp_c'],
+            hour['condition']['text'],
+            hour['condition']['code'],
+            hour.get('chance_of_rain', 0),
+            hour.get('is_day', 1),
+        )
+
+
+def to_columns(records, fields):
+    """Turn a list of __slots__ records into a dict of per-field lists"""
+    return {field: [getattr(record, field) for record in records] for field in fields}
+
+
+def parse_forecast(forecastdays, include_hourly=False):
+    """Parse WeatherAPI forecastday entries into the compact columnar form"""
+    days = [ForecastDay.from_api(forecastday) for forecastday in forecastdays]
+    forecast = {'days': to_columns(days, DAY_FIELDS)}
+    if include_hourly:
+        hours = [ForecastHour.from_api(hour)
+                 for forecastday in forecastdays for hour in forecastday.get('hour', [])]
+        forecast['hours'] = to_columns(hours, HOUR_FIELDS)
+    return forecast
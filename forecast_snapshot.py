@@ -0,0 +1,302 @@
+"""
+Persistent snapshot of the forecast cache.
+
+Every forecast stored in the cache is also appended to one file, so a
+restarted or redeployed worker can answer from it instead of sending its
+first wave of traffic to WeatherAPI. Entries are kept for max_age seconds
+past their TTL: an expired forecast is still served, marked stale, when the
+upstream is down.
+
+The file is a header followed by append-only records (expiry, key, zlib
+compressed JSON); the newest record for a key wins. Readers memory-map it
+read-only and keep an in-process index of record offsets, so workers forked
+from a preloading master share the pages and the index. Other workers pick
+new records up on their next miss.
+
+Writes never run on the request path: set() queues the entry, and a writer
+thread started in each process encodes queued entries and appends them in
+batches under an exclusive file lock. The writer also rewrites the file with
+only the newest record per retained key, and swaps it in atomically, once
+dead records take up most of it, it holds more than max_entries keys, or
+its oldest entry is past max_age. Under gevent (SERVING_MODE=async) the
+writer is a greenlet; it waits for the file lock and compacts in steps that
+yield to requests instead of blocking the worker.
+"""
+
+import atexit
+import json
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends from several processes are not serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'FSN1'
+HEADER = struct.Struct('<4s')
+RECORD = struct.Struct('<dHI')          # expires at, key length, value length
+
+# Rewrite the file once it is this many times larger than its live records
+COMPACT_RATIO = 2
+COMPACT_MIN_BYTES = 1 << 20
+# Entry and age limits are enforced with an eighth of headroom, so a steady
+# stream of new keys compacts every max_entries/8 writes rather than every write
+COMPACT_HEADROOM = 8
+# Records copied between yields while compacting
+COMPACT_STEP = 256
+
+WRITE_QUEUE_SIZE = 1024
+LOCK_RETRY_SECONDS = 0.005
+
+
+class ForecastSnapshot:
+    """Memory-mapped, append-only store of (value, expires_at) by cache key"""
+
+    def __init__(self, path, max_age=86400, max_entries=4096):
+        self.path = path
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._index = {}                # key -> (value offset, value length, expires at)
+        self._buf = None
+        self._file_id = None
+        self._end = 0                   # end of the last complete record read
+        self._live_bytes = 0
+        self._oldest = float('inf')     # lowest expiry read since the file was (re)written
+        self._lock = threading.Lock()
+        self._queue = None
+        self._writer = None
+        self._writer_pid = None
+        self._writer_lock = threading.Lock()
+        self.reads = 0
+        self.writes = 0
+        self.dropped = 0
+        self.compactions = 0
+        with self._lock:
+            self._reload()
+        atexit.register(self.close)
+
+    def _open_for_append(self):
+        """Open the file locked for appending, creating it if needed"""
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+            if fcntl is not None:
+                # Poll rather than block, so a gevent worker keeps serving meanwhile
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        time.sleep(LOCK_RETRY_SECONDS)
+            try:
+                if os.fstat(fd).st_ino == os.stat(self.path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            # Compacted and replaced while we waited for the lock
+            os.close(fd)
+        if os.fstat(fd).st_size == 0:
+            os.write(fd, HEADER.pack(MAGIC))
+        return fd
+
+    def _reload(self):
+        """Map any records appended since the last call; start over if the file was replaced"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        if st is None or st.st_size < HEADER.size:
+            os.close(self._open_for_append())
+            st = os.stat(self.path)
+        file_id = (st.st_dev, st.st_ino)
+        if file_id == self._file_id and st.st_size == len(self._buf):
+            return
+        if file_id != self._file_id:
+            self._index, self._end, self._live_bytes, self._oldest = {}, 0, 0, float('inf')
+        with open(self.path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._end == 0:
+            if buf[:HEADER.size] != MAGIC:
+                buf.close()
+                raise ValueError(f"{self.path} is not a forecast snapshot")
+            self._end = HEADER.size
+        if self._buf is not None:
+            self._buf.close()
+        self._buf, self._file_id = buf, file_id
+        self._scan()
+
+    def _scan(self):
+        offset, size = self._end, len(self._buf)
+        while offset + RECORD.size <= size:
+            expires_at, key_length, value_length = RECORD.unpack_from(self._buf, offset)
+            value_at = offset + RECORD.size + key_length
+            if value_at + value_length > size:
+                break                   # a write still in progress, or cut short by a crash
+            key = self._buf[offset + RECORD.size:value_at].decode('utf-8')
+            previous = self._index.get(key)
+            if previous is not None:
+                self._live_bytes -= previous[1]
+            self._index[key] = (value_at, value_length, expires_at)
+            self._live_bytes += value_length
+            self._oldest = min(self._oldest, expires_at)
+            offset = value_at + value_length
+        self._end = offset
+
+    def get(self, key):
+        """Return (value, expires_at), or None if missing or more than max_age past expiry"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                # Another worker may have stored it since we last looked
+                self._reload()
+                entry = self._index.get(key)
+                if entry is None:
+                    return None
+            value_at, value_length, expires_at = entry
+            if expires_at + self.max_age <= time.time():
+                return None
+            data = self._buf[value_at:value_at + value_length]
+            self.reads += 1
+        return json.loads(zlib.decompress(data)), expires_at
+
+    def set(self, key, value, expires_at):
+        """Queue an entry for the writer thread; dropped (and counted) if the writer is behind"""
+        if self._writer_pid != os.getpid():
+            self._start_writer()
+        try:
+            self._queue.put_nowait((key, value, expires_at))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _start_writer(self):
+        # The writer thread doesn't survive fork; each process starts its own, with its own queue
+        with self._writer_lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+            self._writer = threading.Thread(target=self._run_writer, args=(self._queue,),
+                                            name='forecast-snapshot-writer', daemon=True)
+            self._writer.start()
+            self._writer_pid = os.getpid()
+
+    def _run_writer(self, pending):
+        while True:
+            batch = {}
+            taken = 1
+            item = pending.get()
+            # Take everything queued meanwhile; the newest entry per key wins
+            while item is not None:
+                batch[item[0]] = item
+                try:
+                    item = pending.get_nowait()
+                    taken += 1
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    self._write(batch.values())
+            except Exception as e:
+                logger.warning("Forecast snapshot write failed: %s", e)
+            finally:
+                for _ in range(taken):
+                    pending.task_done()
+            if item is None:
+                return
+
+    def _write(self, entries):
+        records = []
+        for key, value, expires_at in entries:
+            encoded_key = key.encode('utf-8')
+            data = zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+            records.append(RECORD.pack(expires_at, len(encoded_key), len(data)) + encoded_key + data)
+        fd = self._open_for_append()
+        try:
+            with self._lock:
+                self._reload()
+                if os.fstat(fd).st_size > self._end:
+                    # Drop a record left half-written by a crashed worker
+                    os.ftruncate(fd, self._end)
+            os.write(fd, b''.join(records))
+            with self._lock:
+                self.writes += len(records)
+                self._reload()
+                compact = self._needs_compaction()
+            if compact:
+                self._compact(fd)
+        finally:
+            os.close(fd)                # releases the lock
+
+    def _needs_compaction(self):
+        size = len(self._buf)
+        return (size > COMPACT_MIN_BYTES and size > COMPACT_RATIO * self._live_bytes
+                or len(self._index) > self.max_entries
+                or self._oldest + self.max_age * (1 + 1 / COMPACT_HEADROOM) <= time.time())
+
+    def _compact(self, fd):
+        """Rewrite the newest record of each retained key to a new file and swap it in
+
+        Called by the writer with the file lock held. Records are copied from
+        `fd` rather than the shared mapping, so readers are only held up while
+        the index is swapped.
+        """
+        now = time.time()
+        with self._lock:
+            entries = sorted(((expires_at, key, value_at, value_length)
+                              for key, (value_at, value_length, expires_at) in self._index.items()
+                              if expires_at + self.max_age > now), reverse=True)
+        if len(entries) > self.max_entries:
+            entries = entries[:self.max_entries - self.max_entries // COMPACT_HEADROOM]
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC))
+            for i, (expires_at, key, value_at, value_length) in enumerate(entries):
+                if i and i % COMPACT_STEP == 0:
+                    time.sleep(0)       # let requests run (a greenlet switch under gevent)
+                encoded_key = key.encode('utf-8')
+                f.write(RECORD.pack(expires_at, len(encoded_key), value_length))
+                f.write(encoded_key)
+                f.write(os.pread(fd, value_length, value_at))
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self.compactions += 1
+            self._reload()
+
+    def flush(self):
+        """Wait until this process's queued entries are written"""
+        if self._writer_pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        """Write out queued entries and stop this process's writer thread"""
+        with self._writer_lock:
+            if self._writer_pid != os.getpid():
+                return
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+            self._writer, self._writer_pid = None, None
+
+    def __len__(self):
+        return len(self._index)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'path': self.path,
+                'entries': len(self._index),
+                'bytes': len(self._buf),
+                'live_bytes': self._live_bytes,
+                'reads': self.reads,
+                'writes': self.writes,
+                'queued': self._queue.qsize() if self._writer_pid == os.getpid() else 0,
+                'dropped': self.dropped,
+                'compactions': self.compactions,
+            }
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Local city gazetteer for query normalization and autocomplete.
+
+Free-text searches ("NYC", "New York", "new york, us") are resolved to one
+canonical place before the upstream call, and that place's coordinates become
+the WeatherAPI query and the forecast cache key. Typed coordinates are rounded
+to the same precision, so nearby lookups share a key too.
+
+The index is a single file of fixed-size records, a sorted array of
+normalized name keys and a string blob. It is memory-mapped read-only, so
+every gunicorn worker shares one copy through the page cache, and lookups
+are binary searches over the key array.
+
+Build it with `python gazetteer.py` from the bundled data/cities.tsv, or from
+a GeoNames dump (https://download.geonames.org/export/dump/, e.g.
+cities15000.txt) with `python gazetteer.py --geonames cities15000.txt`. The
+app builds the bundled list on first start if no index exists.
+"""
+
+import argparse
+import mmap
+import os
+import re
+import struct
+import threading
+import unicodedata
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+SEED_PATH = os.path.join(DATA_DIR, 'cities.tsv')
+INDEX_PATH = os.path.join(DATA_DIR, 'gazetteer.idx')
+
+MAGIC = b'GAZ1'
+HEADER = struct.Struct('<4sIIIII')      # magic, places, keys, places at, keys at, strings at
+PLACE = struct.Struct('<IffIIH2s4s')    # id, lat, lon, population, name at, name length, country, admin1
+KEY = struct.Struct('<IHI')             # key at, key length, place index
+
+# Coordinates are rounded to about 1 km; finer detail doesn't change the forecast
+COORDINATE_PRECISION = 2
+# Most keys scanned for one autocomplete prefix
+COMPLETE_SCAN_LIMIT = 5000
+
+COUNTRY_ALIASES = {
+    'usa': 'US', 'united states': 'US', 'america': 'US',
+    'uk': 'GB', 'united kingdom': 'GB', 'britain': 'GB', 'great britain': 'GB',
+    'england': 'GB', 'scotland': 'GB', 'wales': 'GB',
+    'uae': 'AE', 'emirates': 'AE',
+}
+
+_COORDINATES_RE = re.compile(r'^\s*(-?\d{1,3}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$')
+_NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_name(text):
+    """Fold accents, case and punctuation: 'São Paulo' and 'sao-paulo' both become 'sao paulo'"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return _NON_ALNUM_RE.sub(' ', text).strip()
+
+
+def coordinates_query(lat, lon):
+    return f'{lat:.{COORDINATE_PRECISION}f},{lon:.{COORDINATE_PRECISION}f}'
+
+
+class Place:
+    """A resolved location; `query` is what is sent upstream and used as the cache key"""
+
+    __slots__ = ('id', 'name', 'country', 'admin1', 'lat', 'lon', 'population')
+
+    def __init__(self, id, name, country, admin1, lat, lon, population):
+        self.id = id
+        self.name = name
+        self.country = country
+        self.admin1 = admin1
+        self.lat = lat
+        self.lon = lon
+        self.population = population
+
+    @property
+    def query(self):
+        return coordinates_query(self.lat, self.lon)
+
+    @property
+    def label(self):
+        """'Portland, OR, US'; resolve() maps a label back to the same place"""
+        parts = [self.name]
+        # Two-letter alphabetic admin codes are US states, Canadian provinces and the like
+        if len(self.admin1) == 2 and self.admin1.isalpha():
+            parts.append(self.admin1)
+        if self.country:
+            parts.append(self.country)
+        return ', '.join(parts)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'country': self.country,
+            'label': self.label,
+            'lat': round(self.lat, 4),
+            'lon': round(self.lon, 4),
+            'query': self.query,
+        }
+
+
+class Gazetteer:
+    """Read-only view of a memory-mapped gazetteer index"""
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.place_count, self.key_count, self._places_at, self._keys_at, self._strings_at = \
+            HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a gazetteer index")
+        self.resolved = 0
+        self.unresolved = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.place_count
+
+    def _string(self, offset, length):
+        start = self._strings_at + offset
+        return self._buf[start:start + length]
+
+    def _key(self, i):
+        offset, length, place = KEY.unpack_from(self._buf, self._keys_at + i * KEY.size)
+        return self._string(offset, length), place
+
+    def _lower_bound(self, key):
+        lo, hi = 0, self.key_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def place(self, i):
+        place_id, lat, lon, population, name_at, name_length, country, admin1 = \
+            PLACE.unpack_from(self._buf, self._places_at + i * PLACE.size)
+        return Place(place_id, self._string(name_at, name_length).decode('utf-8'),
+                     country.rstrip(b'\0').decode('ascii'), admin1.rstrip(b'\0').decode('ascii'),
+                     lat, lon, population)
+
+    def lookup(self, name):
+        """Places whose name or alternate name matches exactly, most populous first"""
+        key = normalize_name(name).encode('utf-8')
+        if not key:
+            return []
+        indexes = set()
+        i = self._lower_bound(key)
+        while i < self.key_count:
+            candidate, place = self._key(i)
+            if candidate != key:
+                break
+            indexes.add(place)
+            i += 1
+        return sorted((self.place(i) for i in indexes), key=lambda p: -p.population)
+
+    def resolve(self, text):
+        """Resolve free text ('NYC', 'Paris, FR', '51.5,-0.12') to a Place, or None if unknown"""
+        match = _COORDINATES_RE.match(text or '')
+        if match:
+            lat, lon = float(match.group(1)), float(match.group(2))
+            if -90 <= lat <= 90 and -180 <= lon <= 180:
+                return Place(None, coordinates_query(lat, lon), '', '', lat, lon, 0)
+            return None
+
+        name, _, qualifier = (text or '').partition(',')
+        places = self.lookup(name)
+        if qualifier.strip():
+            places = [p for p in places if matches_qualifier(p, qualifier)]
+        with self._lock:
+            if places:
+                self.resolved += 1
+            else:
+                self.unresolved += 1
+        return places[0] if places else None
+
+    def complete(self, text, limit=8):
+        """Most populous places whose name starts with the typed text"""
+        name, _, qualifier = (text or '').partition(',')
+        prefix = normalize_name(name).encode('utf-8')
+        if not prefix:
+            return []
+        indexes = set()
+        i = self._lower_bound(prefix)
+        end = min(self.key_count, i + COMPLETE_SCAN_LIMIT)
+        while i < end:
+            candidate, place = self._key(i)
+            if not candidate.startswith(prefix):
+                break
+            indexes.add(place)
+            i += 1
+        places = (self.place(i) for i in indexes)
+        if qualifier.strip():
+            places = (p for p in places if matches_qualifier(p, qualifier, prefix=True))
+        return sorted(places, key=lambda p: -p.population)[:limit]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'places': self.place_count,
+                'keys': self.key_count,
+                'resolved': self.resolved,
+                'unresolved': self.unresolved,
+            }
+
+
+def matches_qualifier(place, qualifier, prefix=False):
+    """Whether the text after the name ('US', 'usa', 'NY', 'OR, US', 'england') describes the place"""
+    codes = [code.lower() for code in (place.country, place.admin1) if code]
+    for part in filter(None, (normalize_name(q) for q in qualifier.split(','))):
+        if prefix:
+            matched = any(code.startswith(part) for code in codes) or any(
+                alias.startswith(part) and code == place.country for alias, code in COUNTRY_ALIASES.items())
+        else:
+            matched = part in codes or COUNTRY_ALIASES.get(part) == place.country
+        if not matched:
+            return False
+    return True
+
+
+def read_seed(path=SEED_PATH):
+    """Yield (id, name, alternate names, lat, lon, country, admin1, population) from data/cities.tsv"""
+    with open(path, encoding='utf-8') as f:
+        rows = (line.rstrip('\n').split('\t') for line in f if line.strip() and not line.startswith('#'))
+        for row_number, (name, alternates, lat, lon, country, admin1, population) in enumerate(rows, 1):
+            yield (row_number, name, [a for a in alternates.split(',') if a], float(lat), float(lon),
+                   country, admin1, int(population))
+
+
+def read_geonames(path):
+    """Yield the same tuples from a GeoNames cities dump, keeping alternate names written in Latin script"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            row = line.rstrip('\n').split('\t')
+            alternates = [a for a in row[3].split(',') if a and normalize_name(a)]
+            yield (int(row[0]), row[1], [row[2]] + alternates, float(row[4]), float(row[5]),
+                   row[8], row[10], int(row[14] or 0))
+
+
+def build_index(rows, path=INDEX_PATH):
+    """Write a gazetteer index file from (id, name, alternates, lat, lon, country, admin1, population) rows"""
+    strings = bytearray()
+    string_offsets = {}
+
+    def add_string(value):
+        offset = string_offsets.get(value)
+        if offset is None:
+            offset = string_offsets[value] = len(strings)
+            strings.extend(value)
+        return offset
+
+    places = bytearray()
+    keys = []
+    for index, (place_id, name, alternates, lat, lon, country, admin1, population) in enumerate(rows):
+        encoded_name = name.encode('utf-8')
+        places.extend(PLACE.pack(place_id, lat, lon, population, add_string(encoded_name),
+                                 len(encoded_name), country.encode('ascii')[:2],
+                                 admin1.encode('ascii', 'ignore')[:4]))
+        for key in {normalize_name(n) for n in [name] + alternates} - {''}:
+            keys.append((key.encode('utf-8'), index))
+    keys.sort()
+
+    key_table = bytearray()
+    for key, index in keys:
+        key_table.extend(KEY.pack(add_string(key), len(key), index))
+
+    place_count = len(places) // PLACE.size
+    places_at = HEADER.size
+    keys_at = places_at + len(places)
+    strings_at = keys_at + len(key_table)
+    # Write to a temporary file first so workers never map a half-written index
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, place_count, len(keys), places_at, keys_at, strings_at))
+        f.write(places)
+        f.write(key_table)
+        f.write(strings)
+    os.replace(tmp_path, path)
+    return place_count, len(keys)
+
+
+def load_gazetteer(path=None):
+    """Open the index at GAZETTEER_PATH, building it from the bundled list if it doesn't exist"""
+    path = path or os.getenv('GAZETTEER_PATH', INDEX_PATH)
+    if not os.path.exists(path):
+        build_index(read_seed(), path)
+    return Gazetteer(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the gazetteer index')
+    parser.add_argument('--geonames', help='GeoNames cities file to index instead of data/cities.tsv')
+    parser.add_argument('--output', default=os.getenv('GAZETTEER_PATH', INDEX_PATH))
+    args = parser.parse_args()
+    rows = read_geonames(args.geonames) if args.geonames else read_seed()
+    place_count, key_count = build_index(rows, args.output)
+    print(f"Indexed {place_count} places under {key_count} names -> {args.output}")
@@ -0,0 +1,51 @@
+"""
+Gunicorn settings, read automatically when gunicorn is started from this directory.
+
+The app is imported once in the master and workers are forked from it, so
+they start with every module imported, templates compiled and the anonymous
+page rendered instead of each paying for that after boot. Set
+GUNICORN_PRELOAD=false to import the app in each worker instead.
+
+SERVING_MODE=async runs gevent workers: each request is a greenlet and every
+blocking call in the app (WeatherAPI and Google requests, sleeps while
+waiting for rate-limit tokens, locks) yields to the others, so one worker
+keeps up to GUNICORN_WORKER_CONNECTIONS requests in flight. The routes are
+the same in both modes.
+"""
+
+import os
+
+SERVING_MODE = os.getenv('SERVING_MODE', 'sync').lower()
+
+if SERVING_MODE == 'async':
+    # Patch before the app (and its locks, sockets and threads) is imported in the master
+    from gevent import monkey
+    monkey.patch_all()
+
+    worker_class = 'gevent'
+    worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+elif SERVING_MODE != 'sync':
+    raise ValueError(f"Unknown SERVING_MODE: {SERVING_MODE}")
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+# Sync workers silent for this long are killed; upstream calls must give up well before
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before workers are forked
+    if server.cfg.preload_app:
+        import weather_app
+        weather_app.warm_up()
+        worst_case = weather_app.http_client.worst_case_seconds()
+        if worst_case >= server.cfg.timeout / 2:
+            server.log.warning("An upstream call can take %.1fs, over half the %ss worker timeout; "
+                               "lower HTTP_READ_TIMEOUT or HTTP_MAX_RETRIES", worst_case, server.cfg.timeout)
+
+
+def pre_fork(server, worker):
+    # Flush and stop the master's log thread so the worker doesn't inherit it, or
+    # records queued before the fork; both start their own on their next record
+    if server.cfg.preload_app:
+        import instrumentation
+        instrumentation.stop_log_listener()
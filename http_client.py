@@ -0,0 +1,331 @@
+"""
+Shared outbound HTTP client.
+
+One pooled requests.Session is used for every upstream call (WeatherAPI and
+Google), so connections are kept alive between page views instead of paying a
+TCP/TLS handshake each time. All calls get connect/read timeouts, idempotent
+requests are retried with backoff, and latency is recorded per upstream host.
+
+Each upstream host also has a circuit breaker. When too many recent calls
+fail or are slow, the circuit opens and calls to that host fail immediately
+with CircuitOpen (a requests exception, so callers fall back to cached data
+as they would for any upstream error) instead of tying up workers. After a
+cool-down a few probe calls are let through; if they succeed the circuit
+closes again.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from instrumentation import UPSTREAM_SECONDS, span
+
+CIRCUIT_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats:
+    """Request count, error count and recent latency samples for one upstream"""
+
+    def __init__(self, window=1024):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, error=False):
+        with self._lock:
+            self.count += 1
+            self.total_seconds += seconds
+            self._samples.append(seconds)
+            if error:
+                self.errors += 1
+
+    def snapshot(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            count, errors, total = self.count, self.errors, self.total_seconds
+
+        def percentile(p):
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 2)
+
+        return {
+            'count': count,
+            'errors': errors,
+            'avg_ms': round(total / count * 1000, 2) if count else 0.0,
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+        }
+
+
+class CircuitOpen(requests.RequestException):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+    def __init__(self, host, retry_after):
+        super().__init__(f"Circuit open for {host}; retrying in {retry_after:.0f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class UpstreamError(requests.RequestException):
+    """An upstream answered with a server error; the message leaves out the URL and its query"""
+
+    def __init__(self, host, status_code):
+        super().__init__(f"{host} returned HTTP {status_code}")
+        self.host = host
+        self.status_code = status_code
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one upstream
+
+    Trips when, over the last `window` seconds and at least `min_calls` calls,
+    the share of failed calls (errors and 5xx) reaches `failure_rate` or the
+    share of calls slower than `slow_call_seconds` reaches `slow_call_rate`.
+    """
+
+    def __init__(self, name, failure_rate=0.5, slow_call_rate=0.5, slow_call_seconds=2.0,
+                 window=30, min_calls=10, open_seconds=30, half_open_probes=1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.window = window
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._state = 'closed'
+        self._opened_at = 0.0
+        self._probes = 0
+        self._calls = deque()           # (time, failed, slow)
+        self._failures = 0
+        self._slow = 0
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def _current_state(self, now):
+        if self._state == 'open' and now - self._opened_at >= self.open_seconds:
+            self._state = 'half_open'
+            self._probes = 0
+        return self._state
+
+    def _reset_window(self):
+        self._calls.clear()
+        self._failures = self._slow = 0
+
+    def _open(self, now):
+        logger.warning("Circuit opened for %s", self.name, extra={
+            'calls': len(self._calls), 'failures': self._failures, 'slow_calls': self._slow,
+            'open_seconds': self.open_seconds})
+        self._state = 'open'
+        self._opened_at = now
+        self._reset_window()
+        self.opened += 1
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def retry_after(self):
+        with self._lock:
+            return max(self._opened_at + self.open_seconds - time.monotonic(), 0.0)
+
+    def allow(self, probe=True):
+        """Whether a call may go out now; in half-open state a probe takes one of the probe slots"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == 'closed':
+                return True
+            if state == 'half_open' and (not probe or self._probes < self.half_open_probes):
+                self._probes += probe
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, seconds, failed):
+        now = time.monotonic()
+        slow = seconds >= self.slow_call_seconds
+        with self._lock:
+            state = self._current_state(now)
+            if state == 'half_open':
+                self._probes = max(self._probes - 1, 0)
+                if failed or slow:
+                    self._open(now)
+                else:
+                    logger.info("Circuit closed for %s", self.name)
+                    self._state = 'closed'
+                    self._reset_window()
+                return
+            if state == 'open':
+                return                  # started before the circuit opened
+
+            self._calls.append((now, failed, slow))
+            self._failures += failed
+            self._slow += slow
+            while self._calls[0][0] <= now - self.window:
+                _, old_failed, old_slow = self._calls.popleft()
+                self._failures -= old_failed
+                self._slow -= old_slow
+            count = len(self._calls)
+            if count >= self.min_calls and (self._failures >= self.failure_rate * count
+                                            or self._slow >= self.slow_call_rate * count):
+                self._open(now)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'state': self._current_state(time.monotonic()),
+                'recent_calls': len(self._calls),
+                'recent_failures': self._failures,
+                'recent_slow_calls': self._slow,
+                'opened': self.opened,
+                'rejected': self.rejected,
+            }
+
+
+class HttpClient:
+    """Pooled keep-alive session with timeouts, retries and latency metrics"""
+
+    def __init__(self, connect_timeout=3.05, read_timeout=5, max_retries=1,
+                 backoff_factor=0.3, pool_connections=10, pool_maxsize=20, circuit=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        # CircuitBreaker settings shared by every upstream; None disables the breakers
+        self.circuit = circuit
+        self.session = requests.Session()
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS']),
+            raise_on_status=False,
+        )
+        # One connection pool per host, each holding up to pool_maxsize keep-alive sockets
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._stats = {}
+        self._breakers = {}
+        self._stats_lock = threading.Lock()
+        # Sockets opened in a gunicorn --preload master must not be reused by its workers
+        os.register_at_fork(after_in_child=self._drop_connections)
+
+    def worst_case_seconds(self):
+        """Longest a call can take with the default timeout: every attempt times out, plus backoff"""
+        attempts = self.max_retries + 1
+        return attempts * sum(self.timeout) + sum(self.backoff_factor * 2 ** i for i in range(self.max_retries))
+
+    def _drop_connections(self):
+        for adapter in self.session.adapters.values():
+            adapter.poolmanager.clear()
+
+    def _upstream_stats(self, host):
+        with self._stats_lock:
+            stats = self._stats.get(host)
+            if stats is None:
+                stats = self._stats[host] = LatencyStats()
+            return stats
+
+    def _breaker(self, host):
+        if self.circuit is None:
+            return None
+        with self._stats_lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(host, **self.circuit)
+            return breaker
+
+    def check(self, url):
+        """Raise CircuitOpen now if the upstream's circuit is open, before any work is spent on a call"""
+        host = urlsplit(url).netloc
+        breaker = self._breaker(host)
+        if breaker is not None and not breaker.allow(probe=False):
+            raise CircuitOpen(host, breaker.retry_after())
+
+    def request(self, method, url, **kwargs):
+        """Send a request through the shared session, applying the default timeout"""
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).netloc
+        stats = self._upstream_stats(host)
+        breaker = self._breaker(host)
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpen(host, breaker.retry_after())
+        start = time.perf_counter()
+        try:
+            with span('upstream_fetch', host):
+                response = self.session.request(method, url, **kwargs)
+        except Exception:
+            elapsed = time.perf_counter() - start
+            stats.record(elapsed, error=True)
+            if breaker is not None:
+                breaker.record(elapsed, failed=True)
+            UPSTREAM_SECONDS.observe(elapsed, upstream=host, status='error')
+            raise
+        elapsed = time.perf_counter() - start
+        stats.record(elapsed, error=response.status_code >= 500)
+        if breaker is not None:
+            breaker.record(elapsed, failed=response.status_code >= 500)
+        UPSTREAM_SECONDS.observe(elapsed, upstream=host, status=response.status_code)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        with self._stats_lock:
+            upstreams = dict(self._stats)
+            breakers = dict(self._breakers)
+        result = {host: stats.snapshot() for host, stats in upstreams.items()}
+        for host, breaker in breakers.items():
+            result.setdefault(host, {})['circuit'] = breaker.snapshot()
+        return result
+
+    def circuit_metrics(self, attribute):
+        """{(host,): value} of a breaker attribute for the labelled /metrics series"""
+        with self._stats_lock:
+            breakers = dict(self._breakers)
+        return {(host,): getattr(breaker, attribute) for host, breaker in breakers.items()}
+
+
+def create_http_client():
+    """Build the shared HTTP client from HTTP_* environment variables"""
+    circuit = None
+    if os.getenv('HTTP_CIRCUIT_ENABLED', 'true').lower() == 'true':
+        circuit = {
+            'failure_rate': float(os.getenv('HTTP_CIRCUIT_FAILURE_RATE', '0.5')),
+            'slow_call_rate': float(os.getenv('HTTP_CIRCUIT_SLOW_CALL_RATE', '0.5')),
+            'slow_call_seconds': float(os.getenv('HTTP_CIRCUIT_SLOW_CALL_MS', '2000')) / 1000,
+            'window': float(os.getenv('HTTP_CIRCUIT_WINDOW', '30')),
+            'min_calls': int(os.getenv('HTTP_CIRCUIT_MIN_CALLS', '10')),
+            'open_seconds': float(os.getenv('HTTP_CIRCUIT_OPEN_SECONDS', '30')),
+            'half_open_probes': int(os.getenv('HTTP_CIRCUIT_HALF_OPEN_PROBES', '1')),
+        }
+    return HttpClient(
+        connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05')),
+        read_timeout=float(os.getenv('HTTP_READ_TIMEOUT', '5')),
+        max_retries=int(os.getenv('HTTP_MAX_RETRIES', '1')),
+        backoff_factor=float(os.getenv('HTTP_RETRY_BACKOFF', '0.3')),
+        pool_maxsize=int(os.getenv('HTTP_POOL_SIZE', '20')),
+        circuit=circuit,
+    )
@@ -0,0 +1,477 @@
+"""
+Request tracing, structured logging and Prometheus metrics.
+
+Every request gets a trace: a request id plus the spans recorded while it
+runs (upstream fetches, JSON parsing, token verification, template rendering,
+session load/save). Span and request durations feed latency histograms that
+/metrics serves in the Prometheus text format, per route and per upstream
+host. Metrics are kept per worker process, so scrape each worker (or run a
+single worker per container) to see the whole picture.
+
+Log records are written as JSON lines by a background thread. Request threads
+only put records on a bounded queue and never block on stdout; if the queue
+is full the record is dropped and counted. Each process starts its own log
+thread on its first record; a preloading gunicorn master stops its thread
+before forking a worker (see gunicorn.conf.py).
+
+Set PROFILE_SLOW_REQUESTS_MS to sample the call stack of requests that run
+longer than that, and log the hottest stacks when they finish.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+
+import jinja2
+from flask import request
+from flask.sessions import SecureCookieSessionInterface
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()
+
+
+# --- Metrics -----------------------------------------------------------------
+
+def _format_labels(names, values):
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class Histogram:
+    """Prometheus-style histogram with a fixed set of label names"""
+
+    def __init__(self, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        bounds = [repr(float(b)) for b in self.buckets] + ['+Inf']
+        for key, counts, total in series:
+            labels = _format_labels(self.labelnames, key)
+            prefix = labels + ',' if labels else ''
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+class CallbackMetric:
+    """Counter or gauge whose value is read from a callable at scrape time
+
+    With label names, the callable returns {label values tuple: value}.
+    """
+
+    def __init__(self, name, documentation, kind, fn, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        if not self.labelnames:
+            return lines + [f'{self.name} {self.fn()}']
+        for key, value in sorted(self.fn().items()):
+            lines.append(f'{self.name}{{{_format_labels(self.labelnames, key)}}} {value}')
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics rendered by the /metrics endpoint"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, fn, labelnames=()):
+        self._metrics.append(CallbackMetric(name, documentation, 'counter', fn, labelnames))
+
+    def gauge(self, name, documentation, fn, labelnames=()):
+        self._metrics.append(CallbackMetric(name, documentation, 'gauge', fn, labelnames))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.warning("Metric %s failed to render: %s", metric.name, e)
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+REQUEST_SECONDS = metrics.histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by route',
+    ('method', 'route', 'status'))
+UPSTREAM_SECONDS = metrics.histogram(
+    'upstream_request_duration_seconds', 'Outbound HTTP call latency, by upstream host',
+    ('upstream', 'status'))
+SPAN_SECONDS = metrics.histogram(
+    'span_duration_seconds', 'Time spent in each traced step', ('span',))
+
+
+# --- Tracing -----------------------------------------------------------------
+
+class Trace:
+    """Spans recorded for one request"""
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.start = time.perf_counter()
+        self.spans = []
+        self.status = None
+        self.profiled = False
+        self.samples = Counter()
+
+    def durations(self):
+        """Total seconds per span name, in first-seen order"""
+        totals = {}
+        for name, _, duration, _ in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration
+        return totals
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+def _start_trace(request):
+    request_id = request.headers.get('X-Request-ID', '')
+    if not request_id or len(request_id) > 64:
+        request_id = uuid.uuid4().hex[:16]
+    trace = _local.trace = Trace(request_id)
+    return trace
+
+
+@contextmanager
+def span(name, detail=None):
+    """Time a block, adding it to the current request's trace and the span histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        SPAN_SECONDS.observe(duration, span=name)
+        trace = current_trace()
+        if trace is not None:
+            trace.spans.append((name, start - trace.start, duration, detail))
+
+
+class TracedTemplate(jinja2.Template):
+    def render(self, *args, **kwargs):
+        with span('template_render', self.name):
+            return super().render(*args, **kwargs)
+
+
+class TracedSessionInterface(SecureCookieSessionInterface):
+    def open_session(self, app, request):
+        # The session is opened before any before_request hook, so the trace starts here
+        _start_trace(request)
+        with span('session_open'):
+            return super().open_session(app, request)
+
+    def save_session(self, app, session, response):
+        with span('session_save'):
+            return super().save_session(app, session, response)
+
+
+# --- Slow-request profiler ---------------------------------------------------
+
+class SlowRequestProfiler:
+    """Sample the stacks of requests that have been running longer than a threshold"""
+
+    def __init__(self, threshold, interval=0.005, sample_rate=1.0, max_stacks=20):
+        self.threshold = threshold
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self.max_stacks = max_stacks
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def begin(self, trace):
+        if random.random() >= self.sample_rate:
+            return
+        trace.profiled = True
+        with self._lock:
+            self._active[threading.get_ident()] = (trace, _current_greenlet())
+            if self._thread is None or not self._thread.is_alive():
+                # Started lazily so each gunicorn worker samples its own threads
+                self._thread = threading.Thread(target=self._run, name='slow-request-profiler',
+                                                daemon=True)
+                self._thread.start()
+
+    def end(self, trace, route):
+        if not trace.profiled:
+            return
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+        if trace.samples:
+            stacks = trace.samples.most_common(self.max_stacks)
+            logger.warning("Slow request profile", extra={
+                'request_id': trace.request_id,
+                'route': route,
+                'samples': sum(trace.samples.values()),
+                'interval_ms': self.interval * 1000,
+                'stacks': [{'stack': stack, 'count': count} for stack, count in stacks],
+            })
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self._lock:
+                slow = [(ident, trace, greenlet) for ident, (trace, greenlet) in self._active.items()
+                        if now - trace.start >= self.threshold]
+            if not slow:
+                continue
+            frames = sys._current_frames()
+            for ident, trace, greenlet in slow:
+                # Under gevent, requests are greenlets sharing one thread; sample where each is waiting
+                frame = greenlet.gr_frame if greenlet is not None else frames.get(ident)
+                if frame is not None:
+                    trace.samples[collapse_stack(frame)] += 1
+
+
+def _current_greenlet():
+    """The running greenlet when gevent has patched threading (SERVING_MODE=async), else None"""
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is None or not monkey.is_module_patched('threading'):
+        return None
+    from greenlet import getcurrent
+    return getcurrent()
+
+
+def collapse_stack(frame):
+    """Root-first 'file:function:line;...' string, as used by flame graph tools"""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+
+# --- Logging -----------------------------------------------------------------
+
+logger = logging.getLogger('weather_app.instrumentation')
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRS = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'trace_id'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any `extra` fields merged in"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'trace_id', None):
+            entry['request_id'] = record.trace_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        elif record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hand records to the log thread, dropping them rather than waiting when it falls behind"""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Keep the traceback structured instead of folding it into the message
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if _listener_pid != os.getpid():
+            # First record in this process (or since the listener was stopped)
+            start_log_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _add_trace_id(record):
+    trace = current_trace()
+    record.trace_id = trace.request_id if trace is not None else None
+    return True
+
+
+_log_queue = None
+_log_handler = None
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def start_log_listener():
+    """Start the log thread for this process, if it isn't running (idempotent)"""
+    global _listener, _listener_pid
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        log_format = os.getenv('LOG_FORMAT', 'json').lower()
+        output = logging.StreamHandler(sys.stdout)
+        if log_format == 'json':
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s'))
+        _listener = QueueListener(_log_queue, output)
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+def stop_log_listener():
+    """Write out the queued records and stop this process's log thread
+
+    gunicorn.conf.py calls this before forking each worker, so workers
+    inherit an empty queue and no log thread (or, under gevent, greenlet);
+    each process starts its own on its next record.
+    """
+    global _listener, _listener_pid
+    with _listener_lock:
+        if _listener_pid != os.getpid():
+            return
+        _listener.stop()
+        _listener, _listener_pid = None, None
+
+
+def setup_logging():
+    """Route the root logger through the background log thread (idempotent)"""
+    global _log_queue, _log_handler
+    if _log_handler is not None:
+        return
+    _log_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+    _log_handler = NonBlockingQueueHandler(_log_queue)
+    _log_handler.addFilter(_add_trace_id)
+    root = logging.getLogger()
+    root.addHandler(_log_handler)
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    start_log_listener()
+    atexit.register(stop_log_listener)
+    metrics.counter('log_records_dropped_total', 'Log records dropped because the log queue was full',
+                    lambda: _log_handler.dropped)
+
+
+# --- Flask integration -------------------------------------------------------
+
+def init_app(app):
+    """Trace every request, record its latency and serve /metrics"""
+    slow_request = float(os.getenv('TRACE_SLOW_REQUEST_MS', '500')) / 1000
+    server_timing = os.getenv('SERVER_TIMING', 'false').lower() == 'true'
+    profile_ms = float(os.getenv('PROFILE_SLOW_REQUESTS_MS', '0'))
+    profiler = None
+    if profile_ms > 0:
+        profiler = SlowRequestProfiler(
+            profile_ms / 1000,
+            interval=float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000,
+            sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', '1')),
+        )
+
+    app.jinja_env.template_class = TracedTemplate
+    if type(app.session_interface) is SecureCookieSessionInterface:
+        app.session_interface = TracedSessionInterface()
+
+    @app.before_request
+    def start_trace():
+        # Already started by TracedSessionInterface unless the app brings its own sessions
+        trace = current_trace() or _start_trace(request)
+        if profiler is not None:
+            profiler.begin(trace)
+
+    @app.after_request
+    def add_trace_headers(response):
+        trace = current_trace()
+        if trace is None:
+            return response
+        trace.status = response.status_code
+        response.headers['X-Request-ID'] = trace.request_id
+        if server_timing:
+            timings = [f'{name};dur={duration * 1000:.1f}' for name, duration in trace.durations().items()]
+            timings.append(f'total;dur={(time.perf_counter() - trace.start) * 1000:.1f}')
+            response.headers['Server-Timing'] = ', '.join(timings)
+        return response
+
+    # Runs after the session is saved, so its span is included
+    @app.teardown_request
+    def finish_trace(exc):
+        trace = current_trace()
+        if trace is None:
+            return
+        _local.trace = None
+        duration = time.perf_counter() - trace.start
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        status = trace.status or 500
+        REQUEST_SECONDS.observe(duration, method=request.method, route=route, status=status)
+        if profiler is not None:
+            profiler.end(trace, route)
+
+        fields = {
+            'request_id': trace.request_id,
+            'method': request.method,
+            'route': route,
+            'status': status,
+            'duration_ms': round(duration * 1000, 2),
+            'spans': [{'name': name, 'start_ms': round(offset * 1000, 2),
+                       'duration_ms': round(span_duration * 1000, 2), 'detail': detail}
+                      for name, offset, span_duration, detail in trace.spans],
+        }
+        logger.log(logging.INFO if duration >= slow_request else logging.DEBUG, "Request finished",
+                   extra=fields)
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        """Latency histograms and counters in the Prometheus text format"""
+        return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,140 @@
+"""
+Server-side store for users' saved locations and profiles.
+
+Saved locations used to live in the signed session cookie, which was
+re-serialized on every request and broke past ~4 KB. They are now kept
+server-side and looked up by (user_id, city), next to each user's profile
+(name, email, picture); the cookie only carries the user id.
+SQLiteLocationStore is the default backend; a shared store (e.g. a network
+database) only needs to implement the LocationStore methods.
+"""
+
+import json
+import os
+from abc import ABC, abstractmethod
+
+from sqlite_util import connect
+
+
+class LocationStore(ABC):
+    """Interface for saved-location backends"""
+
+    @abstractmethod
+    def list(self, user_id):
+        """Return the user's locations as dicts with city, name and temp, oldest first"""
+
+    @abstractmethod
+    def add(self, user_id, city, name, temp):
+        """Add a location unless the user already has one for the city. Returns True if added"""
+
+    @abstractmethod
+    def upsert(self, user_id, city, name, temp):
+        """Add a location, or replace the name and temp of an existing one. Returns True if added"""
+
+    @abstractmethod
+    def delete(self, user_id, city, name):
+        """Delete a location matching city and name. Returns True if one was removed"""
+
+    @abstractmethod
+    def rename(self, user_id, city, old_name, new_name):
+        """Rename a location matching city and old_name. Returns True if one was renamed"""
+
+    @abstractmethod
+    def update_temp(self, user_id, city, temp):
+        """Record the latest temperature for a saved location"""
+
+    @abstractmethod
+    def save_profile(self, user_id, profile):
+        """Store the user's profile dict (name, email, picture, auth method)"""
+
+    @abstractmethod
+    def profile(self, user_id):
+        """Return the user's profile dict, or None if unknown"""
+
+
+class SQLiteLocationStore(LocationStore):
+    """Saved locations in an embedded SQLite database, keyed by (user_id, city)"""
+
+    def __init__(self, path):
+        self.path = path
+        connect(self.path).execute(
+            'CREATE TABLE IF NOT EXISTS saved_locations ('
+            ' user_id TEXT NOT NULL,'
+            ' city TEXT NOT NULL,'
+            ' name TEXT NOT NULL,'
+            ' temp REAL,'
+            ' PRIMARY KEY (user_id, city))'
+        )
+        connect(self.path).execute(
+            'CREATE TABLE IF NOT EXISTS user_profiles ('
+            ' user_id TEXT PRIMARY KEY,'
+            ' profile TEXT NOT NULL)'
+        )
+
+    def list(self, user_id):
+        rows = connect(self.path).execute(
+            'SELECT city, name, temp FROM saved_locations WHERE user_id = ? ORDER BY rowid',
+            (user_id,)
+        ).fetchall()
+        return [{'city': city, 'name': name, 'temp': temp} for city, name, temp in rows]
+
+    def add(self, user_id, city, name, temp):
+        cursor = connect(self.path).execute(
+            'INSERT OR IGNORE INTO saved_locations (user_id, city, name, temp) VALUES (?, ?, ?, ?)',
+            (user_id, city, name, temp)
+        )
+        return cursor.rowcount > 0
+
+    def upsert(self, user_id, city, name, temp):
+        conn = connect(self.path)
+        cursor = conn.execute(
+            'UPDATE saved_locations SET name = ?, temp = ? WHERE user_id = ? AND city = ?',
+            (name, temp, user_id, city)
+        )
+        if cursor.rowcount:
+            return False
+        conn.execute(
+            'INSERT OR REPLACE INTO saved_locations (user_id, city, name, temp) VALUES (?, ?, ?, ?)',
+            (user_id, city, name, temp)
+        )
+        return True
+
+    def delete(self, user_id, city, name):
+        cursor = connect(self.path).execute(
+            'DELETE FROM saved_locations WHERE user_id = ? AND city = ? AND name = ?',
+            (user_id, city, name)
+        )
+        return cursor.rowcount > 0
+
+    def rename(self, user_id, city, old_name, new_name):
+        cursor = connect(self.path).execute(
+            'UPDATE saved_locations SET name = ? WHERE user_id = ? AND city = ? AND name = ?',
+            (new_name, user_id, city, old_name)
+        )
+        return cursor.rowcount > 0
+
+    def update_temp(self, user_id, city, temp):
+        connect(self.path).execute(
+            'UPDATE saved_locations SET temp = ? WHERE user_id = ? AND city = ?',
+            (temp, user_id, city)
+        )
+
+    def save_profile(self, user_id, profile):
+        connect(self.path).execute(
+            'INSERT OR REPLACE INTO user_profiles (user_id, profile) VALUES (?, ?)',
+            (user_id, json.dumps(profile))
+        )
+
+    def profile(self, user_id):
+        row = connect(self.path).execute(
+            'SELECT profile FROM user_profiles WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+def create_location_store():
+    """Build the saved-location store from LOCATION_STORE_* environment variables"""
+    backend_name = os.getenv('LOCATION_STORE_BACKEND', 'sqlite').lower()
+    if backend_name == 'sqlite':
+        return SQLiteLocationStore(os.getenv('LOCATION_STORE_PATH', 'locations.sqlite3'))
+    raise ValueError(f"Unknown LOCATION_STORE_BACKEND: {backend_name}")
@@ -0,0 +1,18 @@
+"""
+NumPy, imported on first use.
+
+Only the bulk API and vectorized weather classification need it, so the
+single-city routes don't pay for the import; a preloading master imports it
+in warm_up() before forking.
+"""
+
+_np = None
+
+
+def numpy():
+    """The numpy module, imported on the first call"""
+    global _np
+    if _np is None:
+        import numpy
+        _np = numpy
+    return _np
@@ -0,0 +1,170 @@
+"""
+Background prefetch of hot cities.
+
+Prefetcher counts lookups per normalized city and, from a scheduler thread,
+re-fetches the most requested cities shortly before their cache entries
+expire. It also runs the background refresh behind stale-while-revalidate.
+All of its upstream calls share a calls-per-minute budget.
+
+With a shared cache backend only one worker needs to prefetch, so workers
+elect a leader by holding an exclusive lock on a file; if the leader exits,
+the lock is released and another worker takes over. The leader ranks cities
+by its own share of the traffic, which gunicorn spreads evenly enough across
+workers to identify the head.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows: every worker acts as leader
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """Keep the most requested cities fresh in the forecast cache"""
+
+    def __init__(self, cache, refresh, top_k=50, lead_time=60, interval=15,
+                 calls_per_minute=30, decay=0.8, lock_path=None):
+        self.cache = cache
+        self.refresh = refresh
+        self.top_k = top_k
+        self.lead_time = lead_time
+        self.interval = interval
+        self.calls_per_minute = calls_per_minute
+        self.decay = decay
+        self.lock_path = lock_path
+        self._counts = {}
+        self._calls = deque()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='prefetch')
+        self.prefetched = 0
+        self.revalidated = 0
+        self.budget_skips = 0
+        self.errors = 0
+
+    def record(self, city):
+        """Count a lookup for a city"""
+        with self._lock:
+            self._counts[city] = self._counts.get(city, 0) + 1
+
+    def hot_cities(self):
+        with self._lock:
+            return heapq.nlargest(self.top_k, self._counts, key=self._counts.get)
+
+    def _take_budget(self):
+        """Reserve one upstream call from the per-minute budget"""
+        now = time.time()
+        with self._lock:
+            while self._calls and self._calls[0] <= now - 60:
+                self._calls.popleft()
+            if len(self._calls) >= self.calls_per_minute:
+                self.budget_skips += 1
+                return False
+            self._calls.append(now)
+            return True
+
+    def _refresh(self, city):
+        try:
+            self.refresh(city)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Background refresh failed for %s: %s", city, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(city)
+
+    def revalidate(self, city):
+        """Refresh a stale city in the background. Returns False if already running or over budget"""
+        with self._lock:
+            if city in self._refreshing:
+                return False
+            self._refreshing.add(city)
+        if not self._take_budget():
+            with self._lock:
+                self._refreshing.discard(city)
+            return False
+        self.revalidated += 1
+        self._executor.submit(self._refresh, city)
+        return True
+
+    def run_once(self):
+        """Refresh hot cities whose entries are missing or about to expire"""
+        hot = self.hot_cities()
+        with self._lock:
+            # Decay counts so the ranking follows recent traffic
+            self._counts = {city: count * self.decay for city, count in self._counts.items()
+                            if count * self.decay >= 0.5}
+
+        deadline = time.time() + self.lead_time
+        for city in hot:
+            entry = self.cache.peek(city)
+            if entry is not None and entry[1] > deadline:
+                continue
+            with self._lock:
+                if city in self._refreshing:
+                    continue
+                self._refreshing.add(city)
+            if not self._take_budget():
+                with self._lock:
+                    self._refreshing.discard(city)
+                break
+            self.prefetched += 1
+            self._refresh(city)
+
+    def is_leader(self):
+        """Try to become (or confirm being) the prefetching worker"""
+        if self.lock_path is None or fcntl is None:
+            return True
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def start(self):
+        """Start the scheduler thread; call after the worker has forked"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='prefetch', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                if self.is_leader():
+                    self.run_once()
+            except Exception as e:
+                logger.exception("Prefetch cycle failed: %s", e)
+
+    def stats(self):
+        with self._lock:
+            tracked = len(self._counts)
+            calls = len(self._calls)
+        return {
+            'leader': self._lock_file is not None or self.lock_path is None or fcntl is None,
+            'tracked_cities': tracked,
+            'calls_last_minute': calls,
+            'calls_per_minute': self.calls_per_minute,
+            'prefetched': self.prefetched,
+            'revalidated': self.revalidated,
+            'budget_skips': self.budget_skips,
+            'errors': self.errors,
+        }
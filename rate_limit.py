@@ -0,0 +1,172 @@
+"""
+Token-bucket rate limiter for WeatherAPI calls.
+
+Every upstream forecast fetch takes a token. The bucket refills at the
+configured calls-per-minute rate up to a burst capacity, and its state is
+kept in a SQLite file by default so all gunicorn workers draw from one budget.
+
+Lookups have a priority. Interactive page views may use the whole bucket and
+wait briefly for a token; batch refreshes and prefetches may only use tokens
+above a reserved floor and never wait, so background work backs off first as
+the budget runs low.
+"""
+
+import os
+import threading
+import time
+
+from http_client import LatencyStats
+from sqlite_util import connect
+
+# Fraction of the bucket each priority must leave untouched
+PRIORITY_RESERVES = {
+    'interactive': 0.0,
+    'batch': 0.2,
+    'prefetch': 0.5,
+}
+
+
+class QuotaExceeded(Exception):
+    """No upstream budget is available for this call"""
+
+    def __init__(self, message, priority=None):
+        super().__init__(message)
+        self.priority = priority
+
+
+class MemoryBucketStore:
+    """Bucket state for a single process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = None
+        self._updated = 0.0
+
+    def take(self, capacity, rate, floor):
+        """Refill, then take one token if that leaves at least floor. Returns (taken, tokens)"""
+        with self._lock:
+            now = time.time()
+            tokens = capacity if self._tokens is None else min(
+                capacity, self._tokens + (now - self._updated) * rate)
+            taken = tokens - 1 >= floor
+            if taken:
+                tokens -= 1
+            self._tokens, self._updated = tokens, now
+            return taken, tokens
+
+    def peek(self, capacity, rate):
+        with self._lock:
+            if self._tokens is None:
+                return capacity
+            return min(capacity, self._tokens + (time.time() - self._updated) * rate)
+
+
+class SQLiteBucketStore:
+    """Bucket state in a SQLite file shared by every worker on the host"""
+
+    def __init__(self, path, name='weatherapi'):
+        self.path = path
+        self.name = name
+        connect(self.path).execute(
+            'CREATE TABLE IF NOT EXISTS rate_buckets ('
+            ' name TEXT PRIMARY KEY,'
+            ' tokens REAL NOT NULL,'
+            ' updated REAL NOT NULL)'
+        )
+
+    def take(self, capacity, rate, floor):
+        conn = connect(self.path)
+        # BEGIN IMMEDIATE serializes the read-modify-write across processes
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute(
+                'SELECT tokens, updated FROM rate_buckets WHERE name = ?', (self.name,)
+            ).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            taken = tokens - 1 >= floor
+            if taken:
+                tokens -= 1
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_buckets (name, tokens, updated) VALUES (?, ?, ?)',
+                (self.name, tokens, now)
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return taken, tokens
+
+    def peek(self, capacity, rate):
+        row = connect(self.path).execute(
+            'SELECT tokens, updated FROM rate_buckets WHERE name = ?', (self.name,)
+        ).fetchone()
+        if row is None:
+            return capacity
+        return min(capacity, row[0] + (time.time() - row[1]) * rate)
+
+
+class RateLimiter:
+    """Priority-aware token bucket in front of an upstream API"""
+
+    def __init__(self, store, calls_per_minute=60, burst=None, max_wait=2.0):
+        self.store = store
+        self.rate = calls_per_minute / 60.0
+        self.capacity = float(burst or calls_per_minute)
+        self.max_wait = max_wait
+        self.acquired = dict.fromkeys(PRIORITY_RESERVES, 0)
+        self.rejected = dict.fromkeys(PRIORITY_RESERVES, 0)
+        self.wait_times = LatencyStats()
+        self._lock = threading.Lock()
+
+    def acquire(self, priority='interactive'):
+        """Take a token, waiting up to max_wait for interactive calls. Raises QuotaExceeded"""
+        floor = self.capacity * PRIORITY_RESERVES[priority]
+        start = time.perf_counter()
+        deadline = start + (self.max_wait if priority == 'interactive' else 0)
+        while True:
+            taken, tokens = self.store.take(self.capacity, self.rate, floor)
+            if taken:
+                self.wait_times.record(time.perf_counter() - start)
+                with self._lock:
+                    self.acquired[priority] += 1
+                return
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                with self._lock:
+                    self.rejected[priority] += 1
+                raise QuotaExceeded(f"Upstream call budget exhausted for {priority} requests", priority)
+            # Sleep until roughly one token has refilled
+            time.sleep(min(remaining, max((floor + 1 - tokens) / self.rate, 0.01)))
+
+    def stats(self):
+        with self._lock:
+            acquired = dict(self.acquired)
+            rejected = dict(self.rejected)
+        return {
+            'tokens': round(self.store.peek(self.capacity, self.rate), 2),
+            'capacity': self.capacity,
+            'calls_per_minute': round(self.rate * 60, 2),
+            'acquired': acquired,
+            'rejected': rejected,
+            'wait': self.wait_times.snapshot(),
+        }
+
+
+def create_rate_limiter():
+    """Build the WeatherAPI rate limiter from its environment settings"""
+    backend_name = os.getenv('WEATHER_API_RATE_BACKEND', 'sqlite').lower()
+    if backend_name == 'sqlite':
+        store = SQLiteBucketStore(os.getenv('WEATHER_API_RATE_PATH', 'rate_limit.sqlite3'))
+    elif backend_name == 'memory':
+        store = MemoryBucketStore()
+    else:
+        raise ValueError(f"Unknown WEATHER_API_RATE_BACKEND: {backend_name}")
+
+    calls_per_minute = int(os.getenv('WEATHER_API_CALLS_PER_MINUTE', '60'))
+    return RateLimiter(
+        store,
+        calls_per_minute=calls_per_minute,
+        burst=int(os.getenv('WEATHER_API_BURST', str(calls_per_minute))),
+        max_wait=float(os.getenv('WEATHER_API_MAX_WAIT', '2')),
+    )
@@ -0,0 +1,28 @@
+"""
+Per-thread, per-process SQLite connections for the on-disk stores.
+
+sqlite3 connections must not be shared between threads, or with a forked
+child (gunicorn --preload workers inherit the master's), so the stores ask
+for a connection on every use and get the one this thread opened in this
+process.
+"""
+
+import os
+import sqlite3
+import threading
+
+_local = threading.local()
+
+
+def connect(path):
+    """This thread's connection to `path` (autocommit, WAL), opened on first use in each process"""
+    connections = getattr(_local, 'connections', None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = sqlite3.connect(path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
@@ -0,0 +1,53 @@
+// Theme management
+document.addEventListener('DOMContentLoaded', function() {
+    var savedTheme = localStorage.getItem('theme') || 'light';
+    document.documentElement.setAttribute('data-theme', savedTheme);
+    document.getElementById('themeToggle').textContent = savedTheme === 'light' ? '🌞' : '🌜';
+});
+
+function toggleTheme() {
+    var html = document.documentElement;
+    var themeToggle = document.getElementById('themeToggle');
+    var newTheme = html.getAttribute('data-theme') === 'light' ? 'dark' : 'light';
+
+    html.setAttribute('data-theme', newTheme);
+    themeToggle.textContent = newTheme === 'light' ? '🌞' : '🌜';
+    localStorage.setItem('theme', newTheme);
+}
+
+// Google Sign-In
+function signInWithGoogle() {
+    const clientId = document.body.dataset.googleClientId;
+    if (!clientId || clientId === "None" || clientId === "") {
+        showError('Google authentication is not configured');
+        return;
+    }
+
+    // Get the current domain
+    const currentDomain = window.location.origin;
+
+    // Construct the redirect URI to match backend
+    const redirectUri = `${currentDomain}/auth/google/callback`;
+    const scope = 'email profile';
+    const authUrl = `https://accounts.google.com/o/oauth2/v2/auth?` +
+        `client_id=${encodeURIComponent(clientId)}&` +
+        `redirect_uri=${encodeURIComponent(redirectUri)}&` +
+        `scope=${encodeURIComponent(scope)}&` +
+        `response_type=code&` +
+        `access_type=offline&` +
+        `prompt=select_account`;
+
+    console.log('Redirect URI:', redirectUri); // For debugging
+    window.location.href = authUrl;
+}
+
+function showError(message) {
+    // Remove existing alerts
+    const existingAlert = document.querySelector('.error');
+    if (existingAlert) existingAlert.remove();
+
+    const errorDiv = document.createElement('div');
+    errorDiv.className = 'error';
+    errorDiv.textContent = message;
+    document.querySelector('.auth-methods').before(errorDiv);
+}
@@ -0,0 +1,529 @@
+// --- GLOBAL FUNCTIONS (for inline onclick) ---
+function toggleTheme() {
+    var html = document.documentElement;
+    var themeToggle = document.getElementById('themeToggle');
+    var newTheme = html.getAttribute('data-theme') === 'light' ? 'dark' : 'light';
+    html.setAttribute('data-theme', newTheme);
+    themeToggle.textContent = newTheme === 'light' ? '🌞' : '🌜';
+    localStorage.setItem('theme', newTheme);
+}
+function showAddLocationModal(prefilledCity = '') {
+    var modal = document.createElement('div');
+    modal.className = 'modal';
+    modal.innerHTML = `
+        <div class="modal-content">
+            <h3>Add New Location</h3>
+            <form id="locationForm" onsubmit="addLocation(event)">
+                <input type="text" id="newLocationCity" placeholder="Enter city name" required value="${prefilledCity}">
+                <input type="text" id="newLocationName" placeholder="Enter display name (optional)" value="${prefilledCity}">
+                <div class="modal-buttons">
+                    <button type="submit">Add</button>
+                    <button type="button" onclick="this.closest('.modal').remove()">Cancel</button>
+                </div>
+            </form>
+        </div>
+    `;
+    document.body.appendChild(modal);
+    setTimeout(() => {
+        if (prefilledCity) {
+            document.getElementById('newLocationName').focus();
+            document.getElementById('newLocationName').select();
+        } else {
+            document.getElementById('newLocationCity').focus();
+        }
+    }, 100);
+}
+function addLocation(event) {
+    event.preventDefault();
+    var city = document.getElementById('newLocationCity').value;
+    var displayName = document.getElementById('newLocationName').value;
+    if (!city) {
+        alert('Please enter a city name');
+        return;
+    }
+    var originalDisplayName = displayName || city;
+    var finalDisplayName = originalDisplayName;
+    var form = document.createElement('form');
+    form.method = 'POST';
+    form.action = '/';
+    var cityInput = document.createElement('input');
+    cityInput.type = 'hidden';
+    cityInput.name = 'city';
+    cityInput.value = city;
+    var nameInput = document.createElement('input');
+    nameInput.type = 'hidden';
+    nameInput.name = 'display_name';
+    nameInput.value = finalDisplayName;
+    var saveInput = document.createElement('input');
+    saveInput.type = 'hidden';
+    saveInput.name = 'save_location';
+    saveInput.value = 'true';
+    form.appendChild(cityInput);
+    form.appendChild(nameInput);
+    form.appendChild(saveInput);
+    document.body.appendChild(form);
+    setTimeout(() => {
+        form.submit();
+    }, 0);
+    // Remove modal
+    var modal = document.getElementById('locationForm');
+    if (modal) modal.closest('.modal').remove();
+}
+function getLocation() {
+    if (navigator.geolocation) {
+        navigator.geolocation.getCurrentPosition(
+            function(position) {
+                var input = document.querySelector('input[name="city"]');
+                input.value = position.coords.latitude + "," + position.coords.longitude;
+                document.getElementById('weatherForm').submit();
+            },
+            function(error) {
+                alert("Unable to get location. Please enter city manually.");
+            }
+        );
+    } else {
+        alert("Geolocation is not supported by this browser.");
+    }
+}
+function addCurrentLocationToPlaces(cityName) {
+    showAddLocationModal(cityName);
+}
+function logout() {
+    if (confirm('Are you sure you want to log out?')) {
+        window.location.href = '/logout';
+    }
+}
+function showEditLocationModal(city, name) {
+    var modal = document.createElement('div');
+    modal.className = 'modal';
+    modal.innerHTML = `
+        <div class="modal-content">
+            <h3>Edit Location Name</h3>
+            <form id="editLocationForm" onsubmit="editLocation(event, '${city}', '${name}')">
+                <input type="text" id="editLocationName" value="${name}" required>
+                <div class="modal-buttons">
+                    <button type="submit">Save</button>
+                    <button type="button" onclick="this.closest('.modal').remove()">Cancel</button>
+                </div>
+            </form>
+        </div>
+    `;
+    document.body.appendChild(modal);
+    setTimeout(() => {
+        document.getElementById('editLocationName').focus();
+    }, 100);
+}
+function editLocation(event, city, oldName) {
+    event.preventDefault();
+    var newName = document.getElementById('editLocationName').value;
+    fetch('/edit_location', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ city: city, old_name: oldName, new_name: newName })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            window.location.reload();
+        } else {
+            alert("Failed to edit location.");
+        }
+    });
+}
+function confirmDeleteLocation(event, city, name) {
+    event.stopPropagation();
+    if (confirm("Do you really want to remove this place from your list?")) {
+        const deleteBtn = event.target;
+        const originalText = deleteBtn.innerHTML;
+        deleteBtn.innerHTML = '⏳';
+        deleteBtn.disabled = true;
+        deleteLocationWithFeedback(event, city, name, deleteBtn, originalText);
+    }
+}
+function deleteLocationWithFeedback(event, city, name, deleteBtn, originalText) {
+    fetch('/delete_location', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ city: city, name: name })
+    })
+    .then(response => {
+        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+        return response.json();
+    })
+    .then(data => {
+        if (data.success) {
+            deleteBtn.innerHTML = '✓';
+            setTimeout(() => { window.location.href = window.location.href; }, 500);
+        } else {
+            alert(`Failed to delete location: ${data.error || 'Unknown error'}`);
+            deleteBtn.innerHTML = originalText;
+            deleteBtn.disabled = false;
+        }
+    })
+    .catch(error => {
+        alert(`Error deleting location: ${error.message}`);
+        deleteBtn.innerHTML = originalText;
+        deleteBtn.disabled = false;
+    });
+}
+function deleteLocation(event, city, name) {
+    deleteLocationWithFeedback(event, city, name, event.target, '&times;');
+}
+function refreshLocations() {
+    var refreshBtn = document.getElementById('refreshLocationsBtn');
+    refreshBtn.disabled = true;
+    refreshBtn.textContent = '⏳ Refreshing...';
+    // Results arrive as one JSON object per line, in the order they complete
+    fetch('/locations/refresh', { method: 'POST' })
+    .then(response => {
+        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        function readChunk() {
+            return reader.read().then(({ done, value }) => {
+                buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+                const lines = buffer.split('\n');
+                buffer = done ? '' : lines.pop();
+                lines.forEach(line => {
+                    if (line.trim()) updateLocationTemp(JSON.parse(line));
+                });
+                if (!done) return readChunk();
+            });
+        }
+        return readChunk();
+    })
+    .catch(error => {
+        alert(`Error refreshing locations: ${error.message}`);
+    })
+    .finally(() => {
+        refreshBtn.disabled = false;
+        refreshBtn.textContent = '⟳ Refresh';
+    });
+}
+function updateLocationTemp(result) {
+    if (!result.success) return;
+    document.querySelectorAll('.location-item').forEach(item => {
+        if (item.dataset.city === result.city) {
+            item.querySelector('.location-temp').textContent = result.temp + '°C';
+        }
+    });
+}
+function getWeather(city) {
+    var input = document.querySelector('input[name="city"]');
+    input.value = city;
+    if (document.body.dataset.clientRendering === 'true') {
+        fetchWeather(city);
+    } else {
+        document.getElementById('weatherForm').submit();
+    }
+}
+function escapeHtml(value) {
+    var div = document.createElement('div');
+    div.textContent = value == null ? '' : String(value);
+    return div.innerHTML;
+}
+function fetchWeather(city) {
+    // Client-side rendering mode: GET the JSON API (cacheable by the browser/CDN) instead of a full-page POST
+    fetch('/api/weather?city=' + encodeURIComponent(city))
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            renderWeather(data.weather);
+        } else {
+            renderWeatherError(data.error || 'Unknown error');
+        }
+    })
+    .catch(error => renderWeatherError(error.message));
+}
+function renderWeather(weather) {
+    var location = escapeHtml(weather.location);
+    var placesButton = document.body.dataset.authenticated === 'true'
+        ? `<button onclick="addCurrentLocationToPlaces(this.dataset.location)" data-location="${location}" class="add-to-places-btn">
+                    ⭐ Add to My Places
+                </button>`
+        : `<a href="/auth" class="add-to-places-btn" style="text-decoration: none;">
+                    🔑 Sign in to save locations
+                </a>`;
+    document.getElementById('weatherResult').innerHTML = `
+        <div class="weather-details">
+            <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 15px;">
+                <h2>🌦️ Weather in ${location}</h2>
+                ${placesButton}
+            </div>
+            <p>🌡️ Temperature: ${escapeHtml(weather.temp_c)}°C</p>
+            <p>🌤️ Condition: ${escapeHtml(weather.condition)}</p>
+            <p>💨 Wind: ${escapeHtml(weather.wind_kph)} km/h</p>
+            <p>💧 Humidity: ${escapeHtml(weather.humidity)}%</p>
+            <p>Feels like: ${escapeHtml(weather.feels_like_c)}°C</p>
+            ${weather.stale ? `<p class="stale-note">⏳ Showing data last updated ${escapeHtml(weather.last_updated)}, refreshing...</p>` : ''}
+        </div>
+    `;
+    document.getElementById('weatherBackground').dataset.weatherType = weather.weather_type || 'default';
+    var timeRow = document.querySelector('.time-row');
+    timeRow.querySelectorAll('#timezone, #localtime').forEach(el => el.remove());
+    if (weather.timezone) {
+        timeRow.insertAdjacentHTML('beforeend',
+            `<span id="timezone" style="display:none;">${escapeHtml(weather.timezone)}</span>` +
+            `<span id="localtime" style="display:none;">${escapeHtml(weather.localtime)}</span>`);
+    }
+}
+// Autocomplete from the server's local gazetteer (/api/places)
+var suggestionCache = new Map();
+var suggestionTimer = null;
+function suggestCities(text) {
+    clearTimeout(suggestionTimer);
+    if (!text) return;
+    suggestionTimer = setTimeout(function() {
+        var cached = suggestionCache.get(text.toLowerCase());
+        if (cached) {
+            showSuggestions(cached);
+            return;
+        }
+        fetch('/api/places?q=' + encodeURIComponent(text))
+            .then(function(response) { return response.json(); })
+            .then(function(data) {
+                suggestionCache.set(text.toLowerCase(), data.places || []);
+                showSuggestions(data.places || []);
+            })
+            .catch(function() {});
+    }, 120);
+}
+function showSuggestions(places) {
+    var list = document.getElementById('citySuggestions');
+    list.replaceChildren.apply(list, places.map(function(place) {
+        var option = document.createElement('option');
+        option.value = place.label;
+        return option;
+    }));
+}
+function renderWeatherError(message) {
+    document.getElementById('weatherResult').innerHTML =
+        `<p class="error">❌ Error: ${escapeHtml(message)}</p>`;
+}
+// --- END GLOBAL FUNCTIONS ---
+
+document.addEventListener('DOMContentLoaded', function() {
+    // Load saved theme on page load
+    var savedTheme = localStorage.getItem('theme') || 'light';
+    document.documentElement.setAttribute('data-theme', savedTheme);
+    document.getElementById('themeToggle').textContent = savedTheme === 'light' ? '🌞' : '🌜';
+
+    // Attach event listeners for profile/user menu
+    var userAvatar = document.getElementById('userAvatar');
+    var userDropdown = document.getElementById('userDropdown');
+    var userMenu = document.getElementById('userMenu');
+    let isDropdownOpen = false;
+    if (userAvatar && userDropdown) {
+        userAvatar.addEventListener('click', function(e) {
+            e.stopPropagation();
+            isDropdownOpen = !isDropdownOpen;
+            userDropdown.classList.toggle('show');
+        });
+        document.addEventListener('click', function(e) {
+            if (isDropdownOpen && !userDropdown.contains(e.target) && !userAvatar.contains(e.target)) {
+                userDropdown.classList.remove('show');
+                isDropdownOpen = false;
+            }
+        });
+        userDropdown.addEventListener('click', function(e) {
+            e.stopPropagation();
+        });
+    }
+
+    // Enhanced search bar logic
+    (function() {
+        const cityInput = document.getElementById('cityInput');
+        const clearBtn = document.getElementById('clearBtn');
+        const form = document.getElementById('weatherForm');
+        cityInput.addEventListener('input', function() {
+            clearBtn.style.display = cityInput.value ? 'flex' : 'none';
+            suggestCities(cityInput.value.trim());
+        });
+        clearBtn.addEventListener('click', function(e) {
+            cityInput.value = '';
+            clearBtn.style.display = 'none';
+            cityInput.focus();
+        });
+        document.getElementById('searchBtn').addEventListener('click', function(e) {
+            if (document.body.dataset.clientRendering === 'true') {
+                e.preventDefault();
+                if (cityInput.value.trim()) getWeather(cityInput.value.trim());
+            } else {
+                form.submit();
+            }
+        });
+        form.addEventListener('submit', function(e) {
+            if (document.body.dataset.clientRendering === 'true') {
+                e.preventDefault();
+                if (cityInput.value.trim()) getWeather(cityInput.value.trim());
+            }
+        });
+    })();
+
+    // Focus/blur for aurora border
+    const container = document.querySelector('.search-bar-container');
+    const input = document.querySelector('.search-input');
+    input.addEventListener('focus', () => container.classList.add('focused'));
+    input.addEventListener('blur', () => container.classList.remove('focused'));
+
+    // Voice Search Overlay Logic (YouTube style, persistent timer)
+    (function() {
+        const micBtn = document.getElementById('micBtn');
+        const overlay = document.getElementById('voiceOverlay');
+        let status = document.getElementById('voiceStatus');
+        let closeBtn = document.getElementById('voiceCloseBtn');
+        const cityInput = document.getElementById('cityInput');
+        const form = document.getElementById('weatherForm');
+        let recognition = null;
+        let silenceTimeout = null;
+        let micRetryBtn = null;
+        let timerStart = null;
+        let timerElapsed = 0;
+        let timerActive = false;
+        function showMicRetry() {
+            const overlayContent = document.getElementById('voiceOverlayContent');
+            overlayContent.classList.add('mic-retry');
+            overlayContent.innerHTML = `
+                <div id="voiceStatus" style="color:#fff; font-size:2rem; margin-bottom:30px; text-align:center;">Didn't hear that. Try again.</div>
+                <button class="mic-retry-mic-btn" id="micRetryBtn" aria-label="Retry">
+                    <svg width="36" height="36" viewBox="0 0 24 24" fill="none" stroke="#fff" stroke-width="2.5" stroke-linecap="round" stroke-linejoin="round"><rect x="9" y="2" width="6" height="12" rx="3"/><path d="M5 10v2a7 7 0 0 0 14 0v-2"/><line x1="12" y1="19" x2="12" y2="22"/><line x1="8" y1="22" x2="16" y2="22"/></svg>
+                </button>
+                <div class="mic-retry-hint">Tap microphone to try again.</div>
+                <button id="voiceCloseBtn" style="position:absolute;top:18px;right:24px;background:none;border:none;color:#fff;font-size:2rem;cursor:pointer;">&times;</button>
+            `;
+            micRetryBtn = document.getElementById('micRetryBtn');
+            micRetryBtn.addEventListener('click', function(e) {
+                e.stopPropagation();
+                // Reset timer/state only on retry
+                timerStart = Date.now();
+                timerElapsed = 0;
+                timerActive = false;
+                overlay.classList.remove('show');
+                setTimeout(() => startVoiceRecognition(), 100);
+            });
+            document.getElementById('voiceCloseBtn').addEventListener('click', function(e) {
+                overlay.classList.remove('show');
+                document.body.style.overflow = '';
+            });
+        }
+        function startVoiceRecognition() {
+            // Restore original overlay content
+            const overlayContent = document.getElementById('voiceOverlayContent');
+            overlayContent.classList.remove('mic-retry');
+            overlayContent.innerHTML = `
+                <div id="voiceStatus">Say a city name to get the weather!</div>
+                <div id="micWave">
+                    <div class="mic-outer">
+                        <div class="mic-inner">
+                            <svg width="60" height="60" viewBox="0 0 60 60">
+                                <circle cx="30" cy="30" r="28" fill="#222"/>
+                                <circle cx="30" cy="30" r="20" fill="#e53935"/>
+                                <rect x="27" y="18" width="6" height="18" rx="3" fill="#fff"/>
+                                <rect x="27" y="36" width="6" height="8" rx="3" fill="#fff" opacity="0.7"/>
+                                <path d="M30 44 v4" stroke="#fff" stroke-width="2.5" stroke-linecap="round"/>
+                                <circle cx="30" cy="50" r="2.5" fill="#fff"/>
+                            </svg>
+                        </div>
+                        <div class="mic-wave"></div>
+                    </div>
+                </div>
+                <button id="voiceCloseBtn" style="position:absolute;top:18px;right:24px;background:none;border:none;color:#fff;font-size:2rem;cursor:pointer;">&times;</button>
+            `;
+            document.getElementById('voiceCloseBtn').addEventListener('click', function(e) {
+                overlay.classList.remove('show');
+                document.body.style.overflow = '';
+            });
+            overlay.classList.add('show');
+            document.body.style.overflow = 'hidden';
+            const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
+            if (!SpeechRecognition) {
+                alert('Sorry, your browser does not support voice recognition.');
+                return;
+            }
+            recognition = new SpeechRecognition();
+            recognition.lang = 'en-US';
+            recognition.interimResults = false;
+            recognition.maxAlternatives = 1;
+            status = document.getElementById('voiceStatus');
+            status.textContent = 'Say a city name to get the weather!';
+            // Timer logic: persist timer if overlay is closed and reopened
+            if (!timerActive) {
+                timerStart = Date.now();
+                timerActive = true;
+            }
+            let checkTimer = function() {
+                if (!timerActive) return;
+                timerElapsed = Date.now() - timerStart;
+                if (timerElapsed >= 10000) {
+                    recognition.abort();
+                    showMicRetry();
+                    timerActive = false;
+                } else if (overlay.classList.contains('show')) {
+                    setTimeout(checkTimer, 100);
+                }
+            };
+            setTimeout(checkTimer, 100);
+            recognition.start();
+            recognition.onresult = function(event) {
+                timerActive = false;
+                const transcript = event.results[0][0].transcript.trim();
+                if (transcript) {
+                    status.textContent = transcript;
+                    setTimeout(() => {
+                        cityInput.value = transcript;
+                        overlay.classList.remove('show');
+                        document.body.style.overflow = '';
+                        form.submit();
+                    }, 1000);
+                } else {
+                    showMicRetry();
+                }
+            };
+            recognition.onerror = function(event) {
+                timerActive = false;
+                showMicRetry();
+            };
+            recognition.onend = function() {
+                timerActive = false;
+            };
+        }
+        micBtn.addEventListener('click', function(e) {
+            if (timerActive && timerElapsed < 10000) {
+                overlay.classList.add('show');
+                document.body.style.overflow = 'hidden';
+            } else {
+                timerActive = false;
+                timerElapsed = 0;
+                startVoiceRecognition();
+            }
+        });
+        // Click outside modal closes overlay
+        overlay.addEventListener('mousedown', function(e) {
+            if (e.target === overlay) {
+                overlay.classList.remove('show');
+                document.body.style.overflow = '';
+            }
+        });
+    })();
+
+    // Time updater
+    function updateTime() {
+        var tzElem = document.getElementById('timezone');
+        var localtimeElem = document.getElementById('localtime');
+        var timeDisplay = document.getElementById('currentTime');
+        if (tzElem && tzElem.textContent) {
+            var tz = tzElem.textContent;
+            var now = new Date();
+            var options = { hour: '2-digit', minute: '2-digit', second: '2-digit', timeZone: tz };
+            timeDisplay.textContent = now.toLocaleTimeString([], options) + ' (' + tz + ')';
+        } else if (localtimeElem && localtimeElem.textContent) {
+            timeDisplay.textContent = localtimeElem.textContent;
+        } else {
+            var now = new Date();
+            timeDisplay.textContent = now.toLocaleTimeString();
+        }
+    }
+    setInterval(updateTime, 1000);
+    updateTime();
+});
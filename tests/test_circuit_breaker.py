@@ -0,0 +1,135 @@
+import pytest
+
+import http_client
+from http_client import CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(http_client.time, 'monotonic', clock)
+    return clock
+
+
+def make_breaker(**kwargs):
+    settings = dict(failure_rate=0.5, slow_call_rate=0.5, slow_call_seconds=2.0,
+                    window=30, min_calls=4, open_seconds=10, half_open_probes=1)
+    settings.update(kwargs)
+    return CircuitBreaker('api.example.com', **settings)
+
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        breaker.record(0.1, failed=True)
+
+
+def test_stays_closed_below_min_calls(clock):
+    breaker = make_breaker()
+    for _ in range(breaker.min_calls - 1):
+        breaker.record(0.1, failed=True)
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+
+def test_opens_at_min_calls_when_the_failure_rate_is_reached(clock):
+    breaker = make_breaker()
+    breaker.record(0.1, failed=False)
+    breaker.record(0.1, failed=False)
+    breaker.record(0.1, failed=True)
+    assert breaker.state == 'closed'
+    breaker.record(0.1, failed=True)
+    assert breaker.state == 'open'
+    assert breaker.opened == 1
+
+
+def test_stays_closed_under_the_failure_rate(clock):
+    breaker = make_breaker()
+    for failed in (False, False, True, False, False, True, False):
+        breaker.record(0.1, failed=failed)
+    assert breaker.state == 'closed'
+
+
+def test_opens_on_slow_calls(clock):
+    breaker = make_breaker()
+    for _ in range(breaker.min_calls):
+        breaker.record(2.5, failed=False)
+    assert breaker.state == 'open'
+
+
+def test_calls_older_than_the_window_are_forgotten(clock):
+    breaker = make_breaker()
+    for _ in range(breaker.min_calls - 1):
+        breaker.record(0.1, failed=True)
+    clock.now += 31
+    breaker.record(0.1, failed=True)
+    assert breaker.state == 'closed'
+    assert breaker.snapshot()['recent_calls'] == 1
+
+
+def test_rejects_calls_while_open(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.now += 4
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+    assert breaker.retry_after() == pytest.approx(6)
+
+
+def test_half_open_after_open_seconds_lets_one_probe_through(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.now += 10
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+    assert not breaker.allow()
+    # check() only asks whether the circuit is open; it takes no probe slot
+    assert breaker.allow(probe=False)
+
+
+def test_successful_probe_closes_the_circuit(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(0.1, failed=False)
+    assert breaker.state == 'closed'
+    assert breaker.snapshot()['recent_calls'] == 0
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_the_circuit(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(0.1, failed=True)
+    assert breaker.state == 'open'
+    assert breaker.opened == 2
+    assert not breaker.allow()
+    clock.now += 10
+    assert breaker.state == 'half_open'
+
+
+def test_slow_probe_reopens_the_circuit(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(3.0, failed=False)
+    assert breaker.state == 'open'
+
+
+def test_calls_started_before_opening_are_not_counted(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    breaker.record(0.1, failed=False)
+    assert breaker.state == 'open'
+    assert breaker.snapshot()['recent_calls'] == 0
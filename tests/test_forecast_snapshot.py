@@ -0,0 +1,144 @@
+import os
+import time
+
+import pytest
+
+import forecast_snapshot
+from forecast_snapshot import HEADER, MAGIC, RECORD, ForecastSnapshot
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'forecast_snapshot.bin')
+
+
+@pytest.fixture
+def open_snapshot():
+    """Open snapshots that stop their writer threads when the test ends"""
+    snapshots = []
+
+    def open_snapshot(path, **kwargs):
+        snapshots.append(ForecastSnapshot(path, **kwargs))
+        return snapshots[-1]
+
+    yield open_snapshot
+    for snapshot in snapshots:
+        snapshot.close()
+
+
+def read_records(path):
+    """(expires_at, key) of every complete record in the file, in file order"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data[:HEADER.size] == MAGIC
+    records, offset = [], HEADER.size
+    while offset + RECORD.size <= len(data):
+        expires_at, key_length, value_length = RECORD.unpack_from(data, offset)
+        key_at = offset + RECORD.size
+        records.append((expires_at, data[key_at:key_at + key_length].decode('utf-8')))
+        offset = key_at + key_length + value_length
+    assert offset == len(data)
+    return records
+
+
+def test_new_file_has_only_the_header(path, open_snapshot):
+    open_snapshot(path)
+    with open(path, 'rb') as f:
+        assert f.read() == HEADER.pack(MAGIC)
+
+
+def test_rejects_a_file_that_is_not_a_snapshot(path):
+    with open(path, 'wb') as f:
+        f.write(b'nope')
+    with pytest.raises(ValueError):
+        ForecastSnapshot(path)
+
+
+def test_entries_survive_a_restart(path, open_snapshot):
+    expires_at = time.time() + 600
+    snapshot = open_snapshot(path)
+    snapshot.set('london', {'temp_c': 12.5}, expires_at)
+    snapshot.flush()
+
+    restarted = open_snapshot(path)
+    assert restarted.get('london') == ({'temp_c': 12.5}, expires_at)
+    assert restarted.get('paris') is None
+    assert read_records(path) == [(expires_at, 'london')]
+
+
+def test_newest_record_for_a_key_wins(path, open_snapshot):
+    snapshot = open_snapshot(path)
+    snapshot.set('london', {'temp_c': 1}, time.time() + 600)
+    snapshot.flush()
+    snapshot.set('london', {'temp_c': 2}, time.time() + 600)
+    snapshot.flush()
+
+    assert len(read_records(path)) == 2
+    assert open_snapshot(path).get('london')[0] == {'temp_c': 2}
+
+
+def test_half_written_record_is_ignored_and_truncated(path, open_snapshot):
+    snapshot = open_snapshot(path)
+    snapshot.set('london', {'temp_c': 12.5}, time.time() + 600)
+    snapshot.flush()
+    complete_size = os.path.getsize(path)
+    # A worker that crashed part way through an append
+    with open(path, 'ab') as f:
+        f.write(RECORD.pack(time.time() + 600, len(b'paris'), 100) + b'paris' + b'\0' * 10)
+
+    restarted = open_snapshot(path)
+    assert len(restarted) == 1
+    assert restarted.get('paris') is None
+
+    restarted.set('berlin', {'temp_c': 8}, time.time() + 600)
+    restarted.flush()
+    assert [key for _, key in read_records(path)] == ['london', 'berlin']
+    assert os.path.getsize(path) > complete_size
+    assert open_snapshot(path).get('berlin')[0] == {'temp_c': 8}
+
+
+def test_get_ignores_entries_more_than_max_age_past_expiry(path, open_snapshot):
+    snapshot = open_snapshot(path, max_age=60)
+    snapshot.set('stale', {'temp_c': 1}, time.time() - 30)
+    snapshot.set('gone', {'temp_c': 2}, time.time() - 90)
+    snapshot.flush()
+
+    assert snapshot.get('stale')[0] == {'temp_c': 1}
+    assert snapshot.get('gone') is None
+
+
+def test_compaction_keeps_only_the_newest_record_per_key(path, open_snapshot, monkeypatch):
+    monkeypatch.setattr(forecast_snapshot, 'COMPACT_MIN_BYTES', 0)
+    snapshot = open_snapshot(path)
+    expires_at = time.time() + 600
+    for version in range(5):
+        snapshot.set('london', {'version': version}, expires_at + version)
+        snapshot.flush()
+
+    assert snapshot.compactions > 0
+    assert read_records(path) == [(expires_at + 4, 'london')]
+    assert open_snapshot(path).get('london')[0] == {'version': 4}
+
+
+def test_compaction_drops_keys_past_max_age(path, open_snapshot):
+    snapshot = open_snapshot(path, max_age=60)
+    snapshot.set('gone', {'temp_c': 1}, time.time() - 120)
+    snapshot.set('fresh', {'temp_c': 2}, time.time() + 600)
+    snapshot.flush()
+
+    assert snapshot.compactions == 1
+    assert [key for _, key in read_records(path)] == ['fresh']
+
+
+def test_compaction_keeps_the_latest_expiring_keys_over_max_entries(path, open_snapshot):
+    snapshot = open_snapshot(path, max_entries=8)
+    now = time.time()
+    for i in range(9):
+        snapshot.set(f'city-{i}', {'i': i}, now + 600 + i)
+    snapshot.flush()
+
+    assert snapshot.compactions == 1
+    # Trimmed to max_entries less the headroom, newest expiry first
+    assert sorted(key for _, key in read_records(path)) == [f'city-{i}' for i in range(2, 9)]
+    assert len(snapshot) == 7
+    assert snapshot.get('city-0') is None
@@ -0,0 +1,96 @@
+import pytest
+
+from gazetteer import Gazetteer, build_index, read_seed
+
+ROWS = [
+    (1, 'Portland', [], 45.52, -122.68, 'US', 'OR', 650000),
+    (2, 'Portland', [], 43.66, -70.26, 'US', 'ME', 68000),
+    (3, 'Paris', [], 48.86, 2.35, 'FR', '11', 2100000),
+    (4, 'Paris', [], 33.66, -95.56, 'US', 'TX', 25000),
+    (5, 'New York City', ['New York', 'NYC'], 40.71, -74.01, 'US', 'NY', 8300000),
+    (6, 'Newark', [], 40.74, -74.17, 'US', 'NJ', 310000),
+    (7, 'São Paulo', ['Sao Paulo'], -23.55, -46.63, 'BR', '27', 12300000),
+    (8, 'Aachen', [], 50.78, 6.08, 'DE', '07', 250000),
+    (9, 'Zurich', ['Zürich'], 47.37, 8.54, 'CH', 'ZH', 420000),
+]
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    path = str(tmp_path / 'gazetteer.idx')
+    build_index(ROWS, path)
+    return Gazetteer(path)
+
+
+def names(places):
+    return [(p.name, p.admin1) for p in places]
+
+
+def test_keys_are_sorted_and_deduplicated(gazetteer):
+    keys = [gazetteer._key(i)[0] for i in range(gazetteer.key_count)]
+    assert keys == sorted(keys)
+    # 'São Paulo' and 'Sao Paulo' fold to one key, as do 'Zurich' and 'Zürich'
+    assert gazetteer.key_count == 11
+    assert len(gazetteer) == len(ROWS)
+
+
+def test_lower_bound(gazetteer):
+    keys = [gazetteer._key(i)[0] for i in range(gazetteer.key_count)]
+    for key in keys:
+        # With duplicate keys the bound is the first of them
+        assert gazetteer._lower_bound(key) == keys.index(key)
+    assert gazetteer._lower_bound(b'') == 0
+    assert gazetteer._lower_bound(b'a') == 0
+    assert gazetteer._lower_bound(b'zzz') == gazetteer.key_count
+    assert gazetteer._lower_bound(b'pari') == keys.index(b'paris')
+    assert gazetteer._lower_bound(b'parisx') == keys.index(b'portland')
+
+
+def test_lookup_returns_every_place_with_the_name_most_populous_first(gazetteer):
+    assert names(gazetteer.lookup('Portland')) == [('Portland', 'OR'), ('Portland', 'ME')]
+    assert names(gazetteer.lookup('paris')) == [('Paris', '11'), ('Paris', 'TX')]
+
+
+def test_lookup_at_both_ends_of_the_key_array(gazetteer):
+    assert names(gazetteer.lookup('Aachen')) == [('Aachen', '07')]
+    assert names(gazetteer.lookup('Zürich')) == [('Zurich', 'ZH')]
+
+
+def test_lookup_misses(gazetteer):
+    assert gazetteer.lookup('Pari') == []
+    assert gazetteer.lookup('Atlantis') == []
+    assert gazetteer.lookup('Zzyzx') == []
+    assert gazetteer.lookup('  ,. ') == []
+
+
+def test_lookup_matches_alternate_names(gazetteer):
+    assert names(gazetteer.lookup('NYC')) == [('New York City', 'NY')]
+    assert names(gazetteer.lookup('sao-paulo')) == [('São Paulo', '27')]
+
+
+def test_complete_scans_only_the_matching_prefix(gazetteer):
+    assert names(gazetteer.complete('new')) == [('New York City', 'NY'), ('Newark', 'NJ')]
+    assert names(gazetteer.complete('new york')) == [('New York City', 'NY')]
+    assert names(gazetteer.complete('p')) == [('Paris', '11'), ('Portland', 'OR'),
+                                              ('Portland', 'ME'), ('Paris', 'TX')]
+    assert gazetteer.complete('q') == []
+
+
+def test_complete_respects_the_limit(gazetteer):
+    assert names(gazetteer.complete('p', limit=2)) == [('Paris', '11'), ('Portland', 'OR')]
+
+
+def test_resolve_applies_the_qualifier(gazetteer):
+    assert gazetteer.resolve('Portland, ME').admin1 == 'ME'
+    assert gazetteer.resolve('Paris, usa').admin1 == 'TX'
+    assert gazetteer.resolve('Paris, DE') is None
+    assert gazetteer.resolve('40.7128,-74.006').query == '40.71,-74.01'
+
+
+def test_every_bundled_name_finds_its_place(tmp_path):
+    path = str(tmp_path / 'gazetteer.idx')
+    build_index(read_seed(), path)
+    gazetteer = Gazetteer(path)
+    for place_id, name, alternates, *_ in read_seed():
+        for text in [name] + alternates:
+            assert place_id in {p.id for p in gazetteer.lookup(text)}, text
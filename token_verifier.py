@@ -0,0 +1,181 @@
+"""
+Google ID-token verification with a local signing-key cache.
+
+google.oauth2.id_token re-downloads Google's signing certificates on every
+call. GoogleTokenVerifier keeps the JWKS in memory for as long as Google's
+Cache-Control headers allow, refreshes it in a background thread shortly
+before it expires, and verifies token signatures locally with PyJWT.
+
+Concurrent refetches share one request, and a token whose key id isn't in a
+fresh cache triggers at most one refetch per `unknown_kid_interval`, so
+forged key ids can't be used to hammer Google's certs endpoint.
+"""
+
+import email.utils
+import logging
+import re
+import threading
+import time
+
+import requests
+
+from http_client import LatencyStats
+from instrumentation import span
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v3/certs'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+_MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+def cache_lifetime(headers, default=300):
+    """Seconds a certificate response may be cached, from its HTTP cache headers"""
+    match = _MAX_AGE_RE.search(headers.get('Cache-Control', ''))
+    if match:
+        return max(int(match.group(1)) - int(headers.get('Age', 0) or 0), 0)
+    expires = headers.get('Expires')
+    if expires:
+        try:
+            return max(email.utils.parsedate_to_datetime(expires).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            pass
+    return default
+
+
+class GoogleTokenVerifier:
+    """Verify Google ID tokens against a locally cached, self-refreshing JWKS"""
+
+    def __init__(self, http_client, client_id, certs_url=GOOGLE_CERTS_URL,
+                 refresh_margin=300, leeway=10, unknown_kid_interval=60):
+        self.http_client = http_client
+        self.client_id = client_id
+        self.certs_url = certs_url
+        self.refresh_margin = refresh_margin
+        self.leeway = leeway
+        self.unknown_kid_interval = unknown_kid_interval
+        self._keys = {}
+        self._expires_at = 0.0
+        self._fetched_at = float('-inf')     # monotonic time of the last fetch attempt
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        self._refresher = None
+        self.latency = LatencyStats()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.stale_keys = 0
+        self.unknown_kids = 0
+
+    def _refresh_keys(self):
+        """Fetch the JWKS, sharing one request among concurrent callers"""
+        self._flights.do('jwks', self._fetch_keys)
+
+    def _fetch_keys(self):
+        import jwt
+        with self._lock:
+            self._fetched_at = time.monotonic()
+        response = self.http_client.get(self.certs_url)
+        response.raise_for_status()
+        keys = {}
+        for jwk in response.json().get('keys', []):
+            keys[jwk['kid']] = jwt.PyJWK(jwk).key
+        with self._lock:
+            self._keys = keys
+            self._expires_at = time.time() + cache_lifetime(response.headers)
+            self.refreshes += 1
+
+    def _start_refresher(self):
+        # Started lazily so each gunicorn worker runs its own thread after fork
+        if self._refresher is None or not self._refresher.is_alive():
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name='google-jwks-refresh', daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(max(self._expires_at - self.refresh_margin - time.time(), 30))
+            try:
+                self._refresh_keys()
+            except Exception as e:
+                logger.warning("Google certificate refresh failed: %s", e)
+
+    def _signing_key(self, kid):
+        with self._lock:
+            key = self._keys.get(kid)
+            fresh = time.time() < self._expires_at
+            recently_fetched = time.monotonic() - self._fetched_at < self.unknown_kid_interval
+        if key is not None and fresh:
+            self.cache_hits += 1
+            return key
+        if fresh and recently_fetched:
+            # Google rotates keys rarely; don't refetch for every token with an unknown kid
+            self.unknown_kids += 1
+            raise ValueError(f"Unknown token signing key: {kid}")
+
+        # Unknown key id or expired cache: Google may have rotated its keys
+        self.cache_misses += 1
+        try:
+            self._refresh_keys()
+        except requests.RequestException as e:
+            # Google unreachable or its circuit open: a known key past its cache lifetime still verifies
+            if key is None:
+                raise
+            self.stale_keys += 1
+            logger.warning("Using cached signing key after refresh failed: %s", e)
+            return key
+        self._start_refresher()
+        with self._lock:
+            key = self._keys.get(kid)
+        if key is None:
+            raise ValueError(f"Unknown token signing key: {kid}")
+        return key
+
+    def verify(self, token):
+        """Return the token's claims, raising ValueError if it is not a valid Google ID token"""
+        # PyJWT and cryptography take longer to import than the rest of the app;
+        # load them on the first sign-in rather than in every worker at boot
+        import jwt
+        start = time.perf_counter()
+        try:
+            with span('token_verify'):
+                kid = jwt.get_unverified_header(token).get('kid')
+                claims = jwt.decode(
+                    token,
+                    self._signing_key(kid),
+                    algorithms=['RS256'],
+                    audience=self.client_id,
+                    leeway=self.leeway,
+                )
+            if claims.get('iss') not in GOOGLE_ISSUERS:
+                raise ValueError(f"Wrong issuer: {claims.get('iss')}")
+        except jwt.PyJWTError as e:
+            self.failures += 1
+            self.latency.record(time.perf_counter() - start, error=True)
+            raise ValueError(str(e)) from e
+        except ValueError:
+            self.failures += 1
+            self.latency.record(time.perf_counter() - start, error=True)
+            raise
+        self.latency.record(time.perf_counter() - start)
+        return claims
+
+    def stats(self):
+        with self._lock:
+            key_count = len(self._keys)
+            expires_in = max(self._expires_at - time.time(), 0)
+        return {
+            'keys': key_count,
+            'expires_in': round(expires_in),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'stale_keys': self.stale_keys,
+            'unknown_kids': self.unknown_kids,
+            'refresh_flights': self._flights.stats(),
+            'latency': self.latency.snapshot(),
+        }
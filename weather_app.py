@@ -1,51 +1,218 @@
-from flask import Flask, render_template, request, session, jsonify, redirect, url_for
-import requests
+from flask import Flask, Response, g, render_template, request, session, jsonify, redirect, url_for
 import os
-from dotenv import load_dotenv
+import json
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
-# Authentication imports
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
-import jwt
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+import requests
+
+# Load .env before anything below reads its settings
+load_dotenv()
+
+# Authentication imports (PyJWT itself is imported on first use, see token_verifier.py)
+from token_verifier import GoogleTokenVerifier
+from forecast_cache import create_forecast_cache, normalize_city
+from gazetteer import load_gazetteer
+from singleflight import SingleFlight
+from http_client import CIRCUIT_STATES, CircuitOpen, UpstreamError, create_http_client
+from forecast_model import parse_forecast
+from bulk_forecast import DailyAggregator, columnar_block
+from conditions import weather_type
+from location_store import create_location_store
+from prefetch import Prefetcher
+from rate_limit import QuotaExceeded, create_rate_limiter
+from assets import register_assets
+from instrumentation import init_app as init_instrumentation, metrics, setup_logging, span
+
+# Structured logs are written by a background thread (see instrumentation.py)
+setup_logging()
+logger = logging.getLogger('weather_app')
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'
-load_dotenv()
+# Fingerprinted static bundles built by `python assets.py`
+register_assets(app)
+# Per-request spans, latency histograms and /metrics
+init_instrumentation(app)
+
 
 API_KEY = os.getenv('WEATHER_API_KEY')
+# Hourly forecast data is not displayed, so it is not requested unless enabled
+FORECAST_HOURLY = os.getenv('FORECAST_HOURLY', 'false').lower() == 'true'
+# Let the page fetch /api/weather and render results in the browser instead of re-posting the form
+CLIENT_SIDE_RENDERING = os.getenv('CLIENT_SIDE_RENDERING', 'false').lower() == 'true'
 # Authentication configuration
 GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
 
-# Print configuration status
-print("=== Authentication Configuration ===")
-print(f"Weather API Key: {'✓ Configured' if API_KEY else '✗ Missing'}")
-print(f"Google Client ID: {'✓ Configured' if GOOGLE_CLIENT_ID else '✗ Missing (Google sign-in disabled)'}")
-print("=====================================")
+# Upstream endpoints (overridable so benchmarks can point at local stand-ins)
+WEATHER_API_URL = os.getenv('WEATHER_API_URL', 'https://api.weatherapi.com/v1/forecast.json')
+GOOGLE_TOKEN_URL = os.getenv('GOOGLE_TOKEN_URL', 'https://oauth2.googleapis.com/token')
+GOOGLE_USERINFO_URL = os.getenv('GOOGLE_USERINFO_URL', 'https://www.googleapis.com/oauth2/v2/userinfo')
+GOOGLE_CERTS_URL = os.getenv('GOOGLE_CERTS_URL', 'https://www.googleapis.com/oauth2/v3/certs')
+
+# Log configuration status
+logger.info("Configuration loaded", extra={
+    'weather_api_key': bool(API_KEY),
+    'google_sign_in': bool(GOOGLE_CLIENT_ID),
+})
+if not API_KEY:
+    logger.warning("WEATHER_API_KEY is missing; weather lookups will fail")
+if not GOOGLE_CLIENT_ID:
+    logger.warning("GOOGLE_CLIENT_ID is missing; Google sign-in is disabled")
+
+# Pooled keep-alive client for every outbound call (see http_client.py for HTTP_* settings)
+http_client = create_http_client()
+
+# Verifies Google ID tokens locally against a cached copy of Google's signing keys
+token_verifier = GoogleTokenVerifier(http_client, GOOGLE_CLIENT_ID, certs_url=GOOGLE_CERTS_URL)
+
+# Shared cache for forecast lookups (see forecast_cache.py for FORECAST_CACHE_* settings)
+forecast_cache = create_forecast_cache()
+# Concurrent cache misses for the same city share one upstream call
+forecast_flights = SingleFlight()
+
+# Shared WeatherAPI call budget; interactive lookups take priority over batch and prefetch
+weather_rate_limiter = create_rate_limiter()
+QUOTA_EXCEEDED_MESSAGE = 'The weather service is busy right now. Please try again in a moment.'
+UPSTREAM_UNAVAILABLE_MESSAGE = 'The weather service is unavailable right now. Please try again shortly.'
+# Shown instead of exception text, which can carry upstream URLs and their API key
+SERVER_ERROR_MESSAGE = 'Something went wrong. Please try again.'
+
+# Keeps the most requested cities fresh and revalidates stale entries in the background
+PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', 'true').lower() == 'true'
+prefetcher = Prefetcher(
+    forecast_cache,
+    lambda city: refresh_weather(city, priority='prefetch'),
+    top_k=int(os.getenv('PREFETCH_TOP_K', '50')),
+    lead_time=int(os.getenv('PREFETCH_LEAD_TIME', '60')),
+    interval=int(os.getenv('PREFETCH_INTERVAL', '15')),
+    calls_per_minute=int(os.getenv('PREFETCH_CALLS_PER_MINUTE', '30')),
+    # With a shared cache only one worker (the lock holder) needs to prefetch
+    lock_path=(os.getenv('FORECAST_CACHE_PATH', 'forecast_cache.sqlite3') + '.prefetch.lock'
+               if os.getenv('FORECAST_CACHE_BACKEND', 'memory').lower() == 'sqlite' else None)
+)
+
+# Caching-layer counters exported next to the latency histograms on /metrics
+metrics.counter('forecast_cache_hits_total', 'Fresh forecast cache hits', lambda: forecast_cache.hits)
+metrics.counter('forecast_cache_stale_hits_total', 'Stale forecast cache hits', lambda: forecast_cache.stale_hits)
+metrics.counter('forecast_cache_misses_total', 'Forecast cache misses', lambda: forecast_cache.misses)
+metrics.counter('forecast_flights_collapsed_total', 'Lookups that joined an in-flight upstream call',
+                lambda: forecast_flights.collapsed)
+metrics.gauge('weather_api_rate_tokens', 'WeatherAPI calls currently available in the rate limit bucket',
+              lambda: weather_rate_limiter.stats()['tokens'])
+metrics.gauge('upstream_circuit_state', 'Circuit breaker state per upstream (0 closed, 1 half-open, 2 open)',
+              lambda: {key: CIRCUIT_STATES[state] for key, state in http_client.circuit_metrics('state').items()},
+              labelnames=('upstream',))
+metrics.counter('upstream_circuit_opened_total', 'Times the circuit breaker opened per upstream',
+                lambda: http_client.circuit_metrics('opened'), labelnames=('upstream',))
+metrics.counter('upstream_circuit_rejected_total', 'Calls failed fast by an open circuit per upstream',
+                lambda: http_client.circuit_metrics('rejected'), labelnames=('upstream',))
+
+# Resolves free-text searches to canonical coordinates (see gazetteer.py); with
+# GAZETTEER_STRICT=true, names it doesn't know are rejected without an upstream call
+gazetteer = load_gazetteer()
+GAZETTEER_STRICT = os.getenv('GAZETTEER_STRICT', 'false').lower() == 'true'
+LOCATION_NOT_FOUND_MESSAGE = 'Location not found'
+
+# Saved locations live server-side; the session cookie only carries the user
+location_store = create_location_store()
+
+# Worker pool for batch refreshes of saved locations; each request may only
+# keep LOCATION_REFRESH_CONCURRENCY lookups in flight at once
+LOCATION_REFRESH_CONCURRENCY = int(os.getenv('LOCATION_REFRESH_CONCURRENCY', '8'))
+refresh_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('LOCATION_REFRESH_WORKERS', '32')),
+    thread_name_prefix='location-refresh'
+)
+
+# Bulk weather API: most cities per request, how many are fetched and
+# streamed per block, and how many of a block's misses one request may have
+# in flight on the shared refresh pool at once
+BULK_MAX_CITIES = int(os.getenv('BULK_MAX_CITIES', '200'))
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', '25'))
+BULK_CONCURRENCY = int(os.getenv('BULK_CONCURRENCY', str(LOCATION_REFRESH_CONCURRENCY)))
+FORECAST_DAYS = 5
+
+def warm_up():
+    """Do first-request work ahead of time. gunicorn.conf.py calls this in the
+    master when preloading, so every worker forks with it already done"""
+    import jwt.algorithms  # noqa: F401  (deferred by token_verifier, pulls in cryptography)
+    import numpy  # noqa: F401  (deferred by numpy_util)
+    with app.test_request_context('/'):
+        # Compiles the page templates and caches the anonymous page
+        anonymous_page()
+    app.jinja_env.get_template('auth.html')
 
 def get_user_locations():
     """Get user locations based on authentication status"""
-    if 'user' in session:
-        user_id = session['user']['id']
-        if 'user_locations' not in session:
-            session['user_locations'] = {}
-        if user_id not in session['user_locations']:
-            session['user_locations'][user_id] = []
-        return session['user_locations'][user_id]
+    if 'user_id' in session:
+        return location_store.list(session['user_id'])
     return []
 
+def current_user():
+    """Profile of the signed-in user, or None"""
+    if 'user_id' not in session:
+        return None
+    if 'user' not in g:
+        # Only the id is in the cookie; the profile is kept in the store
+        g.user = location_store.profile(session['user_id']) or {'id': session['user_id']}
+    return g.user
+
+def sign_in(profile):
+    """Start a session for a verified user, keeping only their id in the cookie"""
+    location_store.save_profile(profile['id'], profile)
+    session['user_id'] = profile['id']
+    session['authenticated'] = True
+    session['just_logged_in'] = True
+
+@app.before_request
+def migrate_legacy_session():
+    """Move the profile and saved locations older sessions carried in the cookie into the store"""
+    profile = session.get('user')
+    if profile is None:
+        return
+    user_id = profile['id']
+    location_store.save_profile(user_id, profile)
+    for location in session.get('user_locations', {}).get(user_id, []):
+        # add() keeps the first entry for a city, as the old list did
+        location_store.add(user_id, location['city'], location['name'], location.get('temp'))
+    session.pop('user_locations', None)
+    session.pop('user')
+    session['user_id'] = user_id
+
+def resolve_city(text):
+    """Return (cache key and upstream query, gazetteer place or None) for free-text input"""
+    place = gazetteer.resolve(text)
+    if place is not None:
+        return place.query, place
+    if GAZETTEER_STRICT:
+        return None, None
+    # Not in the gazetteer: let WeatherAPI try the name as typed
+    return normalize_city(text), None
+
 def require_auth(f):
     """Decorator to require authentication for routes"""
     def decorated_function(*args, **kwargs):
-        if 'user' not in session:
+        if 'user_id' not in session:
             return redirect(url_for('auth_page'))
         return f(*args, **kwargs)
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+@app.before_first_request
+def start_background_jobs():
+    """Start per-worker background threads once the worker has forked"""
+    if PREFETCH_ENABLED:
+        prefetcher.start()
+
 @app.route('/auth')
 def auth_page():
     """Authentication page"""
-    if 'user' in session:
+    if 'user_id' in session:
         return redirect(url_for('index'))
     
     # Get error message from URL parameter (from OAuth callback)
@@ -75,10 +242,10 @@ def google_callback():
         # Construct the redirect URI
         redirect_uri = f"{base_url.rstrip('/')}/auth/google/callback"
         
-        print(f"Callback URL being used: {redirect_uri}")  # For debugging
+        logger.debug("Callback URL being used: %s", redirect_uri)
         
         # Exchange code for tokens
-        token_endpoint = 'https://oauth2.googleapis.com/token'
+        token_endpoint = GOOGLE_TOKEN_URL
         data = {
             'code': code,
             'client_id': GOOGLE_CLIENT_ID,
@@ -87,9 +254,9 @@ def google_callback():
             'grant_type': 'authorization_code'
         }
         
-        response = requests.post(token_endpoint, data=data)
+        response = http_client.post(token_endpoint, data=data)
         if not response.ok:
-            print(f"Token exchange failed: {response.text}")
+            logger.warning("Token exchange failed: %s", response.text)
             return redirect(url_for('auth_page', error='Failed to exchange authorization code'))
         
         tokens = response.json()
@@ -97,45 +264,40 @@ def google_callback():
         
         # Verify the ID token
         try:
-            idinfo = id_token.verify_oauth2_token(
-                id_token_jwt, google_requests.Request(), GOOGLE_CLIENT_ID)
+            idinfo = token_verifier.verify(id_token_jwt)
         except ValueError as e:
-            print(f"Token verification failed: {e}")
+            logger.warning("Token verification failed: %s", e)
             return redirect(url_for('auth_page', error='Invalid token'))
         
         # Get user info
-        userinfo_endpoint = 'https://www.googleapis.com/oauth2/v2/userinfo'
+        userinfo_endpoint = GOOGLE_USERINFO_URL
         headers = {'Authorization': f'Bearer {tokens["access_token"]}'}
-        userinfo_response = requests.get(userinfo_endpoint, headers=headers)
+        userinfo_response = http_client.get(userinfo_endpoint, headers=headers)
         
         if not userinfo_response.ok:
-            print(f"Failed to get user info: {userinfo_response.text}")
+            logger.warning("Failed to get user info: %s", userinfo_response.text)
             return redirect(url_for('auth_page', error='Failed to get user information'))
         
         user_info = userinfo_response.json()
         
         if 'email' not in user_info:
-            print(f"Failed to get user info: {user_info}")
+            logger.warning("Failed to get user info: %s", user_info)
             return redirect(url_for('auth_page', error='Failed to get user information'))
         
         # Create user session
-        session['user'] = {
+        sign_in({
             'id': user_info['id'],
             'email': user_info['email'],
             'name': user_info.get('name', user_info['email']),
             'picture': user_info.get('picture', ''),
             'auth_method': 'google'
-        }
-        session['authenticated'] = True
-        session['just_logged_in'] = True
+        })
         
-        print(f"Google OAuth authentication successful for: {user_info['email']}")
+        logger.info("Google OAuth authentication successful", extra={'user_id': user_info['id']})
         return redirect(url_for('index'))
         
     except Exception as e:
-        print(f"Google callback error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Google callback error: %s", e)
         return redirect(url_for('auth_page', error='Google authentication failed'))
 
 @app.route('/auth/google', methods=['POST'])
@@ -154,38 +316,33 @@ def google_auth():
         
         # Verify the Google token
         try:
-            idinfo = id_token.verify_oauth2_token(
-                credential, google_requests.Request(), GOOGLE_CLIENT_ID)
+            idinfo = token_verifier.verify(credential)
             
-            print(f"Token verification successful for: {idinfo.get('email', 'unknown')}")
+            logger.debug("Token verification successful", extra={'user_id': idinfo.get('sub')})
             
         except ValueError as e:
-            print(f"Google token verification failed: {e}")
-            return jsonify({'success': False, 'error': f'Invalid Google token: {str(e)}'})
+            logger.warning("Google token verification failed: %s", e)
+            return jsonify({'success': False, 'error': 'Invalid Google token'})
         
         # Check if token is for the correct client
         if idinfo.get('aud') != GOOGLE_CLIENT_ID:
-            print(f"Token audience mismatch: {idinfo.get('aud')} != {GOOGLE_CLIENT_ID}")
+            logger.warning("Token audience mismatch: %s != %s", idinfo.get('aud'), GOOGLE_CLIENT_ID)
             return jsonify({'success': False, 'error': 'Invalid token audience'})
         
         # Create user session
-        session['user'] = {
+        sign_in({
             'id': idinfo['sub'],
             'email': idinfo['email'],
             'name': idinfo.get('name', idinfo['email']),
             'picture': idinfo.get('picture', ''),
             'auth_method': 'google'
-        }
-        session['authenticated'] = True
-        session['just_logged_in'] = True
+        })
         
-        print(f"Google authentication successful for: {idinfo['email']}")
+        logger.info("Google authentication successful", extra={'user_id': idinfo['sub']})
         return jsonify({'success': True, 'redirect': url_for('index')})
         
     except Exception as e:
-        print(f"Google authentication error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Google authentication error: %s", e)
         return jsonify({'success': False, 'error': 'Authentication failed. Please try again.'})
 
 @app.route('/logout')
@@ -194,67 +351,75 @@ def logout():
     session.clear()
     return redirect(url_for('auth_page'))
 
+# The logged-out page without weather is identical for every visitor, so each
+# worker renders it once and serves the cached bytes afterwards
+_anonymous_page = {}
+
+def anonymous_page():
+    """Serve the cached anonymous page variant, rendering it on first use"""
+    if 'body' not in _anonymous_page:
+        body = render_template(
+            'index.html',
+            weather=None,
+            error=None,
+            locations=[],
+            current_hour=datetime.now().hour,
+            user=None,
+            is_authenticated=False,
+            client_rendering=CLIENT_SIDE_RENDERING
+        )
+        _anonymous_page['etag'] = hashlib.sha1(body.encode('utf-8')).hexdigest()
+        _anonymous_page['body'] = body
+    
+    response = Response(_anonymous_page['body'], mimetype='text/html')
+    response.set_etag(_anonymous_page['etag'])
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
+    if request.method == 'GET' and not session and not app.debug:
+        return anonymous_page()
+    
     try:
         weather_data = None
         error = None
         locations = get_user_locations()
         
         if request.method == 'POST':
-            city = request.form.get('city').strip().lower()
+            raw_city = request.form.get('city')
+            city, place = resolve_city(raw_city)
             display_name = request.form.get('display_name')
             save_location = request.form.get('save_location')
             
-            if city:
+            if raw_city and raw_city.strip() and not city:
+                error = LOCATION_NOT_FOUND_MESSAGE
+            elif city:
                 try:
-                    url = f"http://api.weatherapi.com/v1/forecast.json?key={API_KEY}&q={city}&days=5&aqi=no"
-                    response = requests.get(url)
-                    data = response.json()
+                    weather_data = fetch_weather(city)
                     
-                    if response.status_code == 200:
-                        weather_data = {
-                            'location': f"{data['location']['name']}, {data['location']['country']}",
-                            'temp_c': data['current']['temp_c'],
-                            'condition': data['current']['condition']['text'],
-                            'humidity': data['current']['humidity'],
-                            'wind_kph': data['current']['wind_kph'],
-                            'feels_like_c': data['current']['feelslike_c'],
-                            'weather_type': get_weather_type(data['current']['condition']['text']),
-                            'forecast': data['forecast']['forecastday'],
-                            'timezone': data['location']['tz_id'],
-                            'localtime': data['location']['localtime']
-                        }
-                        
-                        if save_location == 'true' and 'user' in session:
+                    if weather_data:
+                        if save_location == 'true' and 'user_id' in session:
                             new_location = {
                                 'city': city,
-                                'name': display_name or data['location']['name'],
-                                'temp': data['current']['temp_c']
+                                'name': display_name or (place.name if place and place.id else weather_data['name']),
+                                'temp': weather_data['temp_c']
                             }
-                            # Check if location already exists and update it, or add new one
-                            user_id = session['user']['id']
-                            user_locations = session['user_locations'][user_id]
-                            existing_location = None
-                            for i, loc in enumerate(user_locations):
-                                if loc['city'] == city:
-                                    existing_location = i
-                                    break
-                            
-                            if existing_location is not None:
-                                # Update existing location
-                                session['user_locations'][user_id][existing_location] = new_location
-                                print(f"Updated existing location: {new_location}")
-                            else:
-                                # Add new location
-                                session['user_locations'][user_id].append(new_location)
-                                print(f"Added new location: {new_location}")
-                            
-                            session.modified = True
+                            # Update the location if it already exists, or add a new one
+                            added = location_store.upsert(
+                                session['user_id'], city, new_location['name'], new_location['temp'])
+                            logger.info("Added new location" if added else "Updated existing location",
+                                        extra={'location': new_location})
+                            locations = get_user_locations()
                                 
+                except QuotaExceeded as e:
+                    error = QUOTA_EXCEEDED_MESSAGE
+                    logger.warning("Weather lookup rejected: %s", e)
+                except CircuitOpen:
+                    error = UPSTREAM_UNAVAILABLE_MESSAGE
                 except Exception as e:
-                    error = str(e)
-                    print(f"Error fetching weather: {e}")
+                    error = UPSTREAM_UNAVAILABLE_MESSAGE
+                    logger.exception("Error fetching weather: %s", e)
 
         response = render_template(
             'index.html',
@@ -262,118 +427,370 @@ def index():
             error=error,
             locations=locations,
             current_hour=datetime.now().hour,
-            user=session.get('user'),
-            is_authenticated='user' in session
+            user=current_user(),
+            is_authenticated='user_id' in session,
+            client_rendering=CLIENT_SIDE_RENDERING
         )
         if session.get('just_logged_in'):
             session.pop('just_logged_in')
         return response
                              
     except Exception as e:
-        print(f"Application error: {e}")
-        return str(e), 500
+        logger.exception("Application error: %s", e)
+        return SERVER_ERROR_MESSAGE, 500
 
 @app.route('/delete_location', methods=['POST'])
 def delete_location():
     """Delete a saved location (requires authentication)"""
-    if 'user' not in session:
+    if 'user_id' not in session:
         return jsonify({'success': False, 'error': 'Authentication required'})
         
     try:
         data = request.get_json()
         if not data:
-            print("Delete error: No JSON data received")
+            logger.warning("Delete error: No JSON data received")
             return jsonify({'success': False, 'error': 'No data received'})
             
         raw_city = data.get('city')
         name = data.get('name')
-        user_id = session['user']['id']
+        user_id = session['user_id']
         
         if not raw_city or not name:
-            print(f"Delete error: Missing data - city: {raw_city}, name: {name}")
+            logger.warning("Delete error: Missing data - city: %s, name: %s", raw_city, name)
             return jsonify({'success': False, 'error': 'Missing city or name'})
         
-        city = raw_city.strip().lower()
-        print(f"Attempting to delete - city: '{city}', name: '{name}' for user: {user_id}")
-        
-        if 'user_locations' not in session or user_id not in session['user_locations']:
-            print("No locations found in session for user")
-            return jsonify({'success': False, 'error': 'No locations in session'})
-            
-        user_locations = session['user_locations'][user_id]
-        print(f"Current locations in session: {user_locations}")
-        
-        # Find the location to delete
-        location_found = False
-        for loc in user_locations:
-            if loc['city'] == city and loc['name'] == name:
-                location_found = True
-                break
+        city = normalize_city(raw_city)
+        logger.debug("Attempting to delete - city: %r, name: %r for user: %s", city, name, user_id)
         
-        if not location_found:
-            print(f"Location not found - city: '{city}', name: '{name}'")
-            print(f"Available locations: {[(loc['city'], loc['name']) for loc in user_locations]}")
-            return jsonify({'success': False, 'error': 'Location not found in session'})
+        if not location_store.delete(user_id, city, name):
+            logger.info("Location not found - city: %r, name: %r", city, name)
+            return jsonify({'success': False, 'error': 'Location not found'})
         
-        # Remove the location
-        original_count = len(user_locations)
-        session['user_locations'][user_id] = [
-            loc for loc in user_locations
-            if not (loc['city'] == city and loc['name'] == name)
-        ]
-        
-        new_count = len(session['user_locations'][user_id])
-        session.modified = True
-        
-        if new_count < original_count:
-            print(f"Successfully deleted location. Count changed from {original_count} to {new_count}")
-            return jsonify({'success': True, 'message': 'Location deleted successfully'})
-        else:
-            print(f"Unexpected: No location was removed. Count: {original_count} -> {new_count}")
-            return jsonify({'success': False, 'error': 'Location was not removed'})
+        logger.info("Deleted location - city: %r, name: %r", city, name)
+        return jsonify({'success': True, 'message': 'Location deleted successfully'})
             
     except Exception as e:
-        print(f"Delete location error: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'success': False, 'error': f'Server error: {str(e)}'})
+        logger.exception("Delete location error: %s", e)
+        return jsonify({'success': False, 'error': SERVER_ERROR_MESSAGE})
 
 @app.route('/edit_location', methods=['POST'])
 def edit_location():
     """Edit a saved location (requires authentication)"""
-    if 'user' not in session:
+    if 'user_id' not in session:
         return jsonify({'success': False, 'error': 'Authentication required'})
         
     try:
         data = request.get_json()
-        city = data.get('city').strip().lower()
+        city = normalize_city(data.get('city'))
         old_name = data.get('old_name')
         new_name = data.get('new_name')
-        user_id = session['user']['id']
+        user_id = session['user_id']
         
-        if 'user_locations' in session and user_id in session['user_locations']:
-            for loc in session['user_locations'][user_id]:
-                if loc['city'] == city and loc['name'] == old_name:
-                    loc['name'] = new_name
-                    session.modified = True
-                    break
+        if location_store.rename(user_id, city, old_name, new_name):
             return jsonify({'success': True})
+        return jsonify({'success': False, 'error': 'Location not found'})
+    except Exception as e:
+        logger.exception("Edit location error: %s", e)
+        return jsonify({'success': False, 'error': SERVER_ERROR_MESSAGE})
+
+@app.route('/api/weather')
+def weather_api():
+    """Weather for a city as JSON, with ETag/If-None-Match support"""
+    raw_city = request.args.get('city')
+    if not raw_city or not raw_city.strip():
+        return jsonify({'success': False, 'error': 'Missing city'}), 400
+    city, place = resolve_city(raw_city)
+    if not city:
+        return jsonify({'success': False, 'error': LOCATION_NOT_FOUND_MESSAGE}), 404
+    
+    try:
+        weather_data, expires_at = fetch_weather_entry(city)
+    except QuotaExceeded as e:
+        logger.warning("Weather lookup rejected: %s", e)
+        return jsonify({'success': False, 'error': QUOTA_EXCEEDED_MESSAGE}), 503, {'Retry-After': '5'}
+    except CircuitOpen as e:
+        return (jsonify({'success': False, 'error': UPSTREAM_UNAVAILABLE_MESSAGE}), 503,
+                {'Retry-After': str(max(int(e.retry_after), 1))})
+    except Exception as e:
+        logger.exception("Error fetching weather: %s", e)
+        return jsonify({'success': False, 'error': UPSTREAM_UNAVAILABLE_MESSAGE}), 502
+    
+    if not weather_data:
+        return jsonify({'success': False, 'error': LOCATION_NOT_FOUND_MESSAGE}), 404
+    
+    response = jsonify({'success': True, 'city': city, 'weather': weather_data,
+                        'place': place.to_dict() if place and place.id else None})
+    response.set_etag(weather_etag(city, weather_data))
+    response.cache_control.public = True
+    # Only for as long as the cached entry stays fresh, so shared caches never outlive it
+    response.cache_control.max_age = max(int(expires_at - time.time()), 0)
+    return response.make_conditional(request)
+
+@app.route('/api/places')
+def places_api():
+    """Autocomplete suggestions from the local gazetteer"""
+    limit = max(1, min(request.args.get('limit', 8, type=int), 20))
+    places = gazetteer.complete(request.args.get('q', ''), limit)
+    response = jsonify({'success': True, 'places': [p.to_dict() for p in places]})
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response
+
+def weather_etag(city, weather_data):
+    """Strong ETag that changes whenever WeatherAPI publishes a new observation"""
+    version = (f"{city}|{weather_data.get('last_updated_epoch')}|{weather_data.get('last_updated')}"
+               f"|{bool(weather_data.get('stale'))}")
+    return hashlib.sha1(version.encode('utf-8')).hexdigest()
+
+@app.route('/locations/refresh', methods=['POST'])
+def refresh_locations():
+    """Stream current conditions for every saved location as NDJSON (requires authentication)"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Authentication required'})
+    
+    user_id = session['user_id']
+    locations = get_user_locations()
+    return Response(iter_refreshed_locations(user_id, locations), mimetype='application/x-ndjson')
+
+def refresh_location(user_id, location):
+    """Fetch current conditions for one saved location and store its new temperature"""
+    result = {'city': location['city'], 'name': location['name']}
+    try:
+        weather_data = fetch_weather(location['city'], priority='batch')
+    except QuotaExceeded:
+        result.update(success=False, error=QUOTA_EXCEEDED_MESSAGE)
+        return result
+    except Exception as e:
+        logger.warning("Refresh error for %s: %s", location['city'], e)
+        result.update(success=False, error=UPSTREAM_UNAVAILABLE_MESSAGE)
+        return result
+    
+    if not weather_data:
+        result.update(success=False, error='Location not found')
+        return result
+    
+    location_store.update_temp(user_id, location['city'], weather_data['temp_c'])
+    result.update(
+        success=True,
+        temp=weather_data['temp_c'],
+        condition=weather_data['condition'],
+        weather_type=weather_data['weather_type']
+    )
+    return result
+
+def iter_refreshed_locations(user_id, locations):
+    """Yield one JSON line per location, in completion order"""
+    remaining = iter(locations)
+    pending = set()
+    
+    def submit_next():
+        location = next(remaining, None)
+        if location is not None:
+            pending.add(refresh_executor.submit(refresh_location, user_id, location))
+    
+    for _ in range(LOCATION_REFRESH_CONCURRENCY):
+        submit_next()
+    
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.discard(future)
+            submit_next()
+            yield json.dumps(future.result()) + '\n'
+
+@app.route('/api/weather/bulk', methods=['POST'])
+def bulk_weather_api():
+    """Current conditions and daily forecasts for a list of cities, streamed as columnar NDJSON (requires authentication)"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Authentication required'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    cities = data.get('cities')
+    if not isinstance(cities, list) or not cities:
+        return jsonify({'success': False, 'error': 'Missing cities'}), 400
+    if len(cities) > BULK_MAX_CITIES:
+        return jsonify({'success': False, 'error': f'At most {BULK_MAX_CITIES} cities per request'}), 400
+    
+    # Different spellings of one place resolve to the same key and are fetched
+    # once; rows[i] is the response row answering cities[i]
+    keys, rows = [], []
+    key_rows = {}
+    for raw_city in cities:
+        city, _ = resolve_city(raw_city if isinstance(raw_city, str) else '')
+        if city not in key_rows:
+            key_rows[city] = len(keys)
+            keys.append(city)
+        rows.append(key_rows[city])
+    return Response(iter_bulk_weather(keys, rows), mimetype='application/x-ndjson')
+
+def bulk_lookup(city):
+    """(city, weather data or None, error or None) for one bulk entry"""
+    if not city:
+        return city, None, LOCATION_NOT_FOUND_MESSAGE
+    try:
+        weather_data = fetch_weather(city, priority='batch')
+    except QuotaExceeded:
+        return city, None, QUOTA_EXCEEDED_MESSAGE
+    except CircuitOpen:
+        return city, None, UPSTREAM_UNAVAILABLE_MESSAGE
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
-
-def get_weather_type(condition):
-    condition = condition.lower()
-    if any(word in condition for word in ['rain', 'drizzle', 'shower']):
-        return 'rainy'
-    elif any(word in condition for word in ['cloud', 'overcast']):
-        return 'cloudy'
-    elif any(word in condition for word in ['clear', 'sunny']):
-        return 'clear'
-    return 'default'
+        logger.warning("Bulk lookup failed for %s: %s", city, e)
+        return city, None, UPSTREAM_UNAVAILABLE_MESSAGE
+    if not weather_data:
+        return city, None, LOCATION_NOT_FOUND_MESSAGE
+    return city, weather_data, None
+
+def iter_bulk_lookups(cities):
+    """bulk_lookup() results in order, with at most BULK_CONCURRENCY misses in flight"""
+    # Fresh cache entries are answered inline; only misses go to the worker pool
+    now = time.time()
+    results = [None] * len(cities)
+    misses = []
+    for index, city in enumerate(cities):
+        entry = forecast_cache.peek(city) if city else None
+        if entry is None or entry[1] <= now:
+            misses.append(index)
+        else:
+            results[index] = bulk_lookup(city)
+    
+    remaining = iter(misses)
+    pending = {}
+    
+    def submit_next():
+        index = next(remaining, None)
+        if index is not None:
+            pending[refresh_executor.submit(bulk_lookup, cities[index])] = index
+    
+    for _ in range(BULK_CONCURRENCY):
+        submit_next()
+    
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[pending.pop(future)] = future.result()
+            submit_next()
+    return results
+
+def iter_bulk_weather(cities, rows):
+    """Yield the input-to-row mapping, one columnar block per BULK_CHUNK_SIZE cities, then the per-day summary"""
+    yield json.dumps({'type': 'rows', 'rows': rows}) + '\n'
+    aggregator = DailyAggregator(FORECAST_DAYS)
+    for start in range(0, len(cities), BULK_CHUNK_SIZE):
+        results = iter_bulk_lookups(cities[start:start + BULK_CHUNK_SIZE])
+        block, matrices = columnar_block(results, FORECAST_DAYS)
+        block['first_row'] = start
+        aggregator.update(block, matrices)
+        yield json.dumps(block) + '\n'
+    yield json.dumps(aggregator.summary()) + '\n'
+
+@app.route('/api/stats')
+def stats():
+    """Runtime counters for the upstream caching layers"""
+    return jsonify({
+        'forecast_cache': forecast_cache.stats(),
+        'forecast_flights': forecast_flights.stats(),
+        'upstreams': http_client.stats(),
+        'token_verifier': token_verifier.stats(),
+        'prefetch': prefetcher.stats(),
+        'gazetteer': gazetteer.stats(),
+        'weather_rate_limit': weather_rate_limiter.stats()
+    })
+
+def build_weather_data(data):
+    """Build the template weather dict from a WeatherAPI forecast response"""
+    return {
+        'location': f"{data['location']['name']}, {data['location']['country']}",
+        'name': data['location']['name'],
+        'temp_c': data['current']['temp_c'],
+        'condition': data['current']['condition']['text'],
+        'humidity': data['current']['humidity'],
+        'wind_kph': data['current']['wind_kph'],
+        'feels_like_c': data['current']['feelslike_c'],
+        'weather_type': weather_type(data['current']['condition'].get('code'), data['current'].get('is_day', 1)),
+        'forecast': parse_forecast(data['forecast']['forecastday'], include_hourly=FORECAST_HOURLY),
+        'timezone': data['location']['tz_id'],
+        'localtime': data['location']['localtime'],
+        'last_updated': data['current'].get('last_updated'),
+        'last_updated_epoch': data['current'].get('last_updated_epoch')
+    }
+
+def fetch_weather(city, priority='interactive'):
+    """Get weather for a normalized city, using the forecast cache when possible"""
+    return fetch_weather_entry(city, priority)[0]
+
+def fetch_weather_entry(city, priority='interactive'):
+    """(weather data, expires_at) for a normalized city; stale data has an expiry in the past"""
+    entry = forecast_cache.lookup(city)
+    if entry is not None:
+        weather_data, expires_at = entry
+        prefetcher.record(city)
+        if expires_at > time.time():
+            return weather_data, expires_at
+        # Serve the expired entry, marked stale, while it is refreshed in the background
+        prefetcher.revalidate(city)
+        return dict(weather_data, stale=True), expires_at
+    
+    try:
+        weather_data = refresh_weather(city, priority)
+    except (QuotaExceeded, requests.RequestException) as e:
+        # Out of upstream budget or the upstream is down: fall back to whatever
+        # is cached or in the snapshot, up to FORECAST_SNAPSHOT_MAX_AGE past expiry
+        entry = forecast_cache.peek(city)
+        if entry is None:
+            raise
+        # An open circuit is logged once when it opens, not for every request it turns away
+        logger.log(logging.DEBUG if isinstance(e, CircuitOpen) else logging.WARNING,
+                   "Serving stale forecast for %s: %s", city, e)
+        return dict(entry[0], stale=True), min(entry[1], time.time())
+    
+    if weather_data:
+        prefetcher.record(city)
+    return weather_data, time.time() + forecast_cache.ttl
+
+def refresh_weather(city, priority='interactive'):
+    """Fetch a city from upstream, sharing the call with concurrent requests for it"""
+    try:
+        return forecast_flights.do(city, fetch_weather_upstream, city, priority)
+    except QuotaExceeded as e:
+        # Joined a batch or prefetch flight that gave up without waiting for a
+        # token: interactive lookups retry in a flight of their own, which may wait
+        if priority != 'interactive' or e.priority in (None, 'interactive'):
+            raise
+        return forecast_flights.do((city, priority), fetch_weather_upstream, city, priority)
+
+def fetch_weather_upstream(city, priority='interactive'):
+    """Fetch weather for a normalized city from WeatherAPI and cache the result"""
+    url = WEATHER_API_URL
+    # Fail fast while WeatherAPI's circuit is open, without waiting for a rate limit token
+    http_client.check(url)
+    weather_rate_limiter.acquire(priority)
+    
+    params = {'key': API_KEY, 'q': city, 'days': 5, 'aqi': 'no', 'alerts': 'no'}
+    if not FORECAST_HOURLY:
+        # WeatherAPI returns a single hourly record per day when an hour is given
+        params['hour'] = 12
+    response = http_client.get(url, params=params)
+    if response.status_code >= 500:
+        # A requests error, so callers fall back to cached data; unlike
+        # raise_for_status() its message doesn't carry the URL (and API key)
+        raise UpstreamError(urlsplit(url).netloc, response.status_code)
+    with span('json_parse'):
+        data = response.json()
+    
+    # 2007 is WeatherAPI's "monthly quota exceeded" error code
+    if response.status_code == 429 or data.get('error', {}).get('code') == 2007:
+        raise QuotaExceeded("WeatherAPI quota exceeded")
+    if response.status_code != 200:
+        return None
+    
+    with span('forecast_build'):
+        weather_data = build_weather_data(data)
+    forecast_cache.set(city, weather_data)
+    return weather_data
 
 if __name__ == '__main__':
     os.makedirs('static/media', exist_ok=True)
     if not API_KEY:
         raise ValueError("API_KEY not found in .env file")
-    print("Starting Flask application...")
+    logger.info("Starting Flask application...")
     app.run(debug=True, port=10000)